@@ -1,4 +1,5 @@
 from EyeSelect import (
     eyeselect,
+    pipeline,
     utils
 )
\ No newline at end of file
@@ -0,0 +1,170 @@
+"""Module providing parallel offline processing of recorded sessions."""
+
+import os
+import itertools
+import collections
+import concurrent.futures
+
+import cv2
+import numpy as np
+
+from EyeSelect.face import FaceFinder
+from EyeSelect.eyeselect import EVENTS, EyeSelect, EyeIntermediateObject
+
+# one row per frame, event is empty when nothing was detected
+TABLE_DTYPE = np.dtype([
+    ("frame", "i8"),
+    ("timestamp", "f8"),
+    ("face", "?"),
+    ("event", "U5"),
+] + EyeIntermediateObject.DTYPE.descr)
+
+_finder = None
+
+
+def _init_worker(finder_kwargs):
+    global _finder
+    _finder = FaceFinder(**finder_kwargs)
+
+
+def _read_video(path, start, end=None):
+    """frames start to end of a video file, to its last frame when end is None"""
+
+    cap = cv2.VideoCapture(path)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    for _ in (itertools.count() if end is None else range(start, end)):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        yield frame
+    cap.release()
+
+
+def _process_chunk(frames, start, first, end, fps, eyeselect_kwargs, thresholds):
+    """processes frames with indices from start, rows before first only warm
+    up gesture state and are not returned"""
+
+    # a fresh gesture state per chunk, the face mesh graph is reused
+    _finder.reset()
+
+    detected = []
+    callbacks = {
+        f"{event}_cb": (lambda event=event: detected.append(event))
+        for event in EVENTS
+    }
+    eyeselect = EyeSelect(finder=_finder, **callbacks, **eyeselect_kwargs)
+
+    table = np.zeros(end - first, dtype=TABLE_DTYPE)
+    for name in EyeIntermediateObject.DTYPE.names:
+        table[name] = np.nan
+
+    count = 0
+    for index, frame in zip(itertools.count(start), frames):
+        timestamp = index / fps
+        detected.clear()
+        eyeselect.eio = None
+        eyeselect.process(frame, timestamp=timestamp, **thresholds)
+
+        if index < first:
+            continue
+
+        row = table[count]
+        row["frame"] = index
+        row["timestamp"] = timestamp
+        if eyeselect.eio is not None:
+            row["face"] = True
+            eyeselect.eio.toRecord(row)
+            if detected:
+                row["event"] = detected[-1]
+        count += 1
+
+    return table[:count]
+
+
+def _video_chunk(path, start, end, warmup, fps, eyeselect_kwargs, thresholds):
+    first = max(start - warmup, 0)
+    return _process_chunk(_read_video(path, first, end), first, start, end, fps,
+                          eyeselect_kwargs, thresholds)
+
+
+def process_video(source, workers=None, chunk_size=900, warmup=60, fps=None,
+                  finder_kwargs=None, eyeselect_kwargs=None, chunk_bytes=256 * 2**20,
+                  **thresholds):
+    """Processes a video file or an iterable of frames across a process pool
+
+    Frames are split into chunks of chunk_size, every worker process owns its
+    own FaceFinder. Video files are read by the workers themselves, frames of
+    an iterable are pickled to them, so their chunks (and warmup) are further
+    limited to chunk_bytes of frames and only workers + 1 of them are in
+    flight. Files whose frame count can't be read are read sequentially and
+    their frames are sent like those of an iterable. Each chunk starts with a fresh gesture state warmed up on
+    `warmup` preceding frames, so baselines are per chunk rather than per
+    session, use longer chunks when that matters. Timestamps are frame index
+    divided by fps (taken from the video file or 30 by default) and are used
+    for event relaxation instead of the wall clock.
+
+    Returns structured array with TABLE_DTYPE, one row per frame, feature
+    fields are NaN for frames without a face.
+    """
+
+    finder_kwargs = dict(static_image_mode=False) if finder_kwargs is None else finder_kwargs
+    eyeselect_kwargs = {} if eyeselect_kwargs is None else eyeselect_kwargs
+    workers = workers or os.cpu_count() or 1
+
+    tables = []
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(finder_kwargs,)) as pool:
+
+        # bounded number of chunks in flight keeps memory independent of
+        # the length of the footage
+        futures = collections.deque()
+
+        def submit(limit, *args):
+            if len(futures) >= limit:
+                tables.append(futures.popleft().result())
+            futures.append(pool.submit(*args))
+
+        frames = None
+        if isinstance(source, str):
+            cap = cv2.VideoCapture(source)
+            count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if fps is None:
+                fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+            cap.release()
+
+            if count > 0:
+                for start in range(0, count, chunk_size):
+                    submit(2 * workers, _video_chunk, source, start,
+                           min(start + chunk_size, count), warmup, fps,
+                           eyeselect_kwargs, thresholds)
+            else:
+                # unknown length (some containers and streams)
+                frames = _read_video(source, 0)
+        else:
+            fps = 30.0 if fps is None else fps
+            frames = iter(source)
+
+        first = None if frames is None else next(frames, None)
+        if first is not None:
+            # every frame is pickled, keep chunks within chunk_bytes
+            size = min(chunk_size, max(chunk_bytes // max(first.nbytes, 1), 1))
+            frames = itertools.chain((first,), frames)
+            history = []
+            start = 0
+            while True:
+                chunk = list(itertools.islice(frames, size))
+                if not chunk:
+                    break
+                submit(workers + 1, _process_chunk, history + chunk, start - len(history),
+                       start, start + len(chunk), fps, eyeselect_kwargs, thresholds)
+                history = chunk[-min(warmup, size):] if warmup else []
+                start += len(chunk)
+
+        tables.extend(future.result() for future in futures)
+
+    if not tables:
+        return np.zeros(0, dtype=TABLE_DTYPE)
+    return np.concatenate(tables)
@@ -0,0 +1,214 @@
+"""Module providing a small learned gesture classifier over feature windows."""
+
+import argparse
+
+import numpy as np
+
+from EyeSelect.eyeselect import EVENTS
+
+# EyeIntermediateObject fields fed to the model, one row per frame
+FEATURES = (
+    "x",
+    "y",
+    "std_x",
+    "std_y",
+    "d_std_r",
+    "d_std_l",
+    "u_std_r",
+    "u_std_l",
+    "max_radius",
+    "max_dist_x",
+    "max_dist_y",
+)
+
+# model outputs, "none" when no gesture is made
+CLASSES = ("none",) + EVENTS
+
+
+def forward(layers, inputs):
+    """class probabilities of a (n, inputs) batch, hidden layers use relu"""
+
+    hidden = inputs
+    for weights, bias in layers[:-1]:
+        hidden = np.maximum(hidden @ weights + bias, 0.0)
+    weights, bias = layers[-1]
+    logits = hidden @ weights + bias
+    logits -= logits.max(axis=-1, keepdims=True)
+    exp = np.exp(logits)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+class GestureClassifier:
+    """Classifies the last `window` frames of features
+
+    Weights come from a .npz file written by save(): window, mean and std of
+    the flattened window used for normalization and W0, b0, W1, b1, ...
+    of the layers. A single layer is logistic regression, more layers make a
+    small MLP. add() appends a frame and runs the model once, a gesture is
+    reported when its probability reaches threshold.
+
+    Pass it to EyeSelect(classifier=...) to replace the rule based detectors.
+    """
+
+    def __init__(self, path=None, model=None, threshold=0.8):
+        if model is None:
+            model = dict(np.load(path))
+        self.threshold = threshold
+        self.window = int(model["window"])
+        self.mean = model["mean"]
+        self.std = model["std"]
+        self.layers = []
+        while f"W{len(self.layers)}" in model:
+            index = len(self.layers)
+            self.layers.append((model[f"W{index}"], model[f"b{index}"]))
+
+        # frames are written twice, so the last `window` of them are always
+        # a contiguous slice
+        self.__frames = np.zeros((2 * self.window, len(FEATURES)))
+        self.__head = 0
+        self.__count = 0
+        self.probabilities = np.zeros(len(CLASSES))
+        self.probabilities[0] = 1.0
+
+    def add(self, eio):
+        """adds features of a frame, returns class probabilities"""
+
+        row = [getattr(eio, name) for name in FEATURES]
+        head = self.__head
+        self.__frames[head] = row
+        self.__frames[head + self.window] = row
+        self.__head = (head + 1) % self.window
+        self.__count = min(self.__count + 1, self.window)
+
+        if self.__count < self.window:
+            return self.probabilities
+
+        inputs = self.__frames[self.__head:self.__head + self.window].reshape(1, -1)
+        self.probabilities = forward(self.layers, (inputs - self.mean) / self.std)[0]
+        return self.probabilities
+
+    def gesture(self):
+        """most likely gesture when confident enough, None otherwise"""
+
+        index = int(np.argmax(self.probabilities))
+        if index and self.probabilities[index] >= self.threshold:
+            return CLASSES[index]
+        return None
+
+    def clear(self):
+        self.__count = 0
+        self.probabilities[:] = 0.0
+        self.probabilities[0] = 1.0
+
+
+def windows(features, labels=None, window=10, span=0.3):
+    """Flattened windows of consecutive face frames of a feature table
+    (batch.TABLE_DTYPE) and class index of their last frame
+
+    A frame belongs to a labeled (timestamp, gesture) when it lies up to
+    span seconds after the label, frames without a label are "none".
+    """
+
+    matrix = np.stack([features[name] for name in FEATURES], axis=1).astype(np.float64)
+    face = features["face"].astype(bool)
+
+    targets = np.zeros(len(features), dtype=np.int64)
+    for timestamp, gesture in labels or ():
+        inside = (features["timestamp"] >= timestamp) & (features["timestamp"] <= timestamp + span)
+        targets[inside] = CLASSES.index(gesture)
+
+    # window ends preceded by window - 1 face frames
+    run = np.zeros(len(features), dtype=np.int64)
+    count = 0
+    for index in range(len(features)):
+        count = count + 1 if face[index] else 0
+        run[index] = count
+    ends = np.nonzero(run >= window)[0]
+
+    offsets = np.arange(-window + 1, 1)
+    inputs = matrix[ends[:, None] + offsets[None, :]].reshape(len(ends), window * len(FEATURES))
+    return inputs, targets[ends]
+
+
+def train(features, labels, window=10, hidden=0, span=0.3, epochs=2000,
+          learning_rate=0.1, l2=1e-4, seed=0):
+    """Fits a classifier on feature tables and labels
+
+    features is a feature table or a list of them (one per session), labels
+    the (timestamp, gesture) pairs of each. Uses full batch gradient descent
+    on class balanced cross entropy. hidden > 0 adds a relu layer of that
+    size. Returns the model dict accepted by GestureClassifier and save().
+    """
+
+    if isinstance(features, np.ndarray):
+        features = [features]
+        labels = [labels]
+
+    parts = [windows(table, session, window, span) for table, session in zip(features, labels)]
+    inputs = np.concatenate([part[0] for part in parts])
+    targets = np.concatenate([part[1] for part in parts])
+
+    mean = inputs.mean(axis=0)
+    std = inputs.std(axis=0) + 1e-6
+    inputs = (inputs - mean) / std
+
+    classes = len(CLASSES)
+    onehot = np.eye(classes)[targets]
+    counts = np.bincount(targets, minlength=classes).astype(np.float64)
+    weight = (len(targets) / (classes * np.maximum(counts, 1)))[targets][:, None]
+
+    rng = np.random.default_rng(seed)
+    sizes = [inputs.shape[1]] + ([hidden] if hidden else []) + [classes]
+    layers = [(rng.normal(0.0, np.sqrt(2.0 / n_in), (n_in, n_out)), np.zeros(n_out))
+              for n_in, n_out in zip(sizes[:-1], sizes[1:])]
+
+    for _ in range(epochs):
+        activations = [inputs]
+        for weights, bias in layers[:-1]:
+            activations.append(np.maximum(activations[-1] @ weights + bias, 0.0))
+        probabilities = forward(layers[-1:], activations[-1])
+
+        grad = weight * (probabilities - onehot) / len(targets)
+        for index in range(len(layers) - 1, -1, -1):
+            weights, bias = layers[index]
+            grad_weights = activations[index].T @ grad + l2 * weights
+            grad_bias = grad.sum(axis=0)
+            if index:
+                grad = (grad @ weights.T) * (activations[index] > 0)
+            layers[index] = (weights - learning_rate * grad_weights,
+                             bias - learning_rate * grad_bias)
+
+    model = {"window": np.array(window), "mean": mean, "std": std}
+    for index, (weights, bias) in enumerate(layers):
+        model[f"W{index}"] = weights
+        model[f"b{index}"] = bias
+    return model
+
+
+def save(path, model):
+    np.savez(path, **model)
+
+
+if __name__ == "__main__":
+    # python -m EyeSelect.classifier model.npz features.npy labels.csv [...]
+    from EyeSelect.tuning import load_labels
+
+    parser = argparse.ArgumentParser(description="trains a gesture classifier")
+    parser.add_argument("model")
+    parser.add_argument("sessions", nargs="+", help="pairs of feature table (.npy) and labels (.csv)")
+    parser.add_argument("--window", type=int, default=10)
+    parser.add_argument("--hidden", type=int, default=0)
+    parser.add_argument("--span", type=float, default=0.3)
+    parser.add_argument("--epochs", type=int, default=2000)
+    args = parser.parse_args()
+
+    tables = [np.load(path) for path in args.sessions[0::2]]
+    labels = [load_labels(path) for path in args.sessions[1::2]]
+    model = train(tables, labels, args.window, args.hidden, args.span, args.epochs)
+    save(args.model, model)
+
+    inputs, targets = zip(*(windows(table, session, args.window, args.span)
+                            for table, session in zip(tables, labels)))
+    predicted = forward(GestureClassifier(model=model).layers,
+                        (np.concatenate(inputs) - model["mean"]) / model["std"]).argmax(axis=1)
+    print(f"training accuracy {np.mean(predicted == np.concatenate(targets)):.3f}")
@@ -0,0 +1,90 @@
+"""Module providing the debug window of tracked pupil positions."""
+
+import time
+import threading
+
+import cv2
+import numpy as np
+
+
+class DebugVisualizer:
+    """Draws pupil buffers of EyeSelect on its own thread
+
+    update() only copies the latest buffer contents, rendering into a
+    preallocated canvas and cv2.imshow/cv2.waitKey run on the visualizer
+    thread at most `fps` times per second, so detection timing doesn't depend
+    on the GUI. Some platforms (macOS) only allow GUI calls from the main
+    thread, start(threaded=False) and call render() from it there.
+    """
+
+    DOT_RADIUS = 5
+
+    def __init__(self, width=1000, height=1000, fps=15, window="Dot Display"):
+        self.width = width
+        self.height = height
+        self.fps = fps
+        self.window = window
+
+        self.canvas = np.full((height, width, 3), 255, dtype=np.uint8)
+        self.frames = 0
+
+        self.run = False
+        self.thread = None
+        self.__snapshot = None
+        self.__lock = threading.Lock()
+
+    def start(self, threaded=True):
+        self.run = True
+        if threaded:
+            self.thread = threading.Thread(target=self.__loop, daemon=True)
+            self.thread.start()
+        return self
+
+    def stop(self):
+        self.run = False
+        if self.thread is not None:
+            self.thread.join(timeout=1.0)
+            self.thread = None
+
+    def update(self, l_points, r_points):
+        """stores a copy of pupil positions (in canvas pixels) to draw next"""
+
+        snapshot = (np.array(l_points), np.array(r_points))
+        with self.__lock:
+            self.__snapshot = snapshot
+
+    def render(self):
+        """draws the latest snapshot, returns False when there was none"""
+
+        with self.__lock:
+            snapshot = self.__snapshot
+            self.__snapshot = None
+
+        if snapshot is None:
+            cv2.waitKey(1)
+            return False
+
+        canvas = self.canvas
+        canvas[:] = 255
+        l_points, r_points = snapshot
+        for l_dot in l_points:
+            cv2.circle(canvas, (int(l_dot[0]), int(l_dot[1])), self.DOT_RADIUS, (0, 0, 255), -1)
+        for r_dot in r_points:
+            cv2.circle(canvas, (int(r_dot[0]), int(r_dot[1])), self.DOT_RADIUS, (255, 0, 0), -1)
+
+        cv2.imshow(self.window, canvas)
+        cv2.waitKey(1)
+        self.frames += 1
+        return True
+
+    def __loop(self):
+        period = 1.0 / self.fps
+        next_frame = time.monotonic()
+        while self.run:
+            self.render()
+            next_frame += period
+            delay = next_frame - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                next_frame = time.monotonic()
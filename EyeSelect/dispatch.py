@@ -0,0 +1,128 @@
+"""Module providing gesture callback dispatch off the detection thread."""
+
+import time
+import threading
+import collections
+
+from EyeSelect.stats import Histogram
+
+
+class CallbackDispatcher:
+    """Queues gesture callbacks to worker threads
+
+    EyeSelect(dispatcher=...) wraps its callbacks with wrap(), detection then
+    only appends to a queue and slow callbacks can't delay the next frame.
+
+    maxsize            pending calls kept, the oldest is dropped when full
+    drop_duplicates    a gesture already waiting in the queue isn't queued again
+    coalesce           seconds after queueing a gesture during which the same
+                       gesture is dropped, 0 disables it
+    workers            threads running callbacks, calls of different gestures
+                       may run out of order with more than one
+    """
+
+    def __init__(self, maxsize=16, drop_duplicates=True, coalesce=0.0, workers=1):
+        self.drop_duplicates = drop_duplicates
+        self.coalesce = coalesce
+
+        self.__items = collections.deque()
+        self.__maxsize = maxsize
+        self.__pending = collections.Counter()
+        self.__last = {}
+        self.__condition = threading.Condition()
+        self.closed = False
+
+        self.__stats = collections.defaultdict(self.__new_stats)
+        self.threads = [threading.Thread(target=self.__work, daemon=True)
+                        for _ in range(workers)]
+        for thread in self.threads:
+            thread.start()
+
+    @staticmethod
+    def __new_stats():
+        return {"calls": 0, "dropped": 0, "coalesced": 0, "errors": 0,
+                "wait": Histogram(), "run": Histogram()}
+
+    def wrap(self, name, callback):
+        """function queueing callback under gesture name, None stays None"""
+
+        if callback is None:
+            return None
+        return lambda *args: self.submit(name, callback, *args)
+
+    def submit(self, name, callback, *args):
+        """queues callback(*args), returns False when it was coalesced"""
+
+        now = time.monotonic()
+        with self.__condition:
+            if self.closed:
+                return False
+
+            stats = self.__stats[name]
+            if (self.drop_duplicates and self.__pending[name]) or \
+                    (self.coalesce and now - self.__last.get(name, -self.coalesce) < self.coalesce):
+                stats["coalesced"] += 1
+                return False
+
+            if len(self.__items) == self.__maxsize:
+                dropped = self.__items.popleft()
+                self.__pending[dropped[0]] -= 1
+                self.__stats[dropped[0]]["dropped"] += 1
+
+            self.__items.append((name, callback, args, now))
+            self.__pending[name] += 1
+            self.__last[name] = now
+            self.__condition.notify()
+            return True
+
+    def __work(self):
+        while True:
+            with self.__condition:
+                while not self.__items:
+                    if self.closed:
+                        return
+                    self.__condition.wait()
+                name, callback, args, queued = self.__items.popleft()
+                self.__pending[name] -= 1
+
+            start = time.monotonic()
+            error = False
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"Exception in {name} callback: {e}")
+                error = True
+            end = time.monotonic()
+
+            with self.__condition:
+                stats = self.__stats[name]
+                stats["calls"] += 1
+                stats["errors"] += error
+                stats["wait"].add(start - queued)
+                stats["run"].add(end - start)
+
+    def close(self, wait=True):
+        """stops workers after the queued callbacks ran"""
+
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+        if wait:
+            for thread in self.threads:
+                thread.join()
+
+    def getStats(self):
+        """per gesture counts, queue wait and callback run time in seconds"""
+
+        with self.__condition:
+            return {
+                name: {
+                    "calls": stats["calls"],
+                    "dropped": stats["dropped"],
+                    "coalesced": stats["coalesced"],
+                    "errors": stats["errors"],
+                    "wait": stats["wait"].summary(),
+                    "run": stats["run"].summary(),
+                }
+                for name, stats in self.__stats.items()
+            }
@@ -4,6 +4,8 @@ import cv2
 import numpy as np
 import mediapipe as mp
 
+from EyeSelect.frame import as_frame
+
 
 class Eye:
     """Class storing data related and representing a eye"""
@@ -39,10 +41,12 @@ class Eye:
         self.center_x = 0
         self.center_y = 0
         self.image = None
+        self.frame = None
         self.pupil = [0.0,0.0]
         self.offset = None
         self.region = None
         self.cut_image = None
+        self.bounds = None
         self.landmarks = None
         self.minMax = [
             [0.0,0.0],
@@ -53,10 +57,12 @@ class Eye:
 
         # self._process(self.image,self.region)
 
-    def update(self, image: np.ndarray, landmarks: list, offset: np.ndarray):
-        """function updating data stored inside eye object"""
+    def update(self, image, landmarks: list, offset: np.ndarray):
+        """function updating data stored inside eye object, image is a BGR
+        array, a frame.Frame or None"""
 
-        self.image = image
+        self.frame = as_frame(image)
+        self.image = None if self.frame is None else self.frame.image
         self.offset = offset
         self.landmarks = landmarks
 
@@ -101,6 +107,8 @@ class Eye:
         """function returning image of the eye cut from the entire face image"""
 
         # TODO: draw additional parameters
+        if self.cut_image is None and self.frame is not None and self.bounds is not None:
+            self.cut_image = self._cut()
         return self.cut_image
 
     def getGaze(self, gaze_buffor, y_correction=0, x_correction=0):
@@ -142,28 +150,25 @@ class Eye:
         return (self.x,self.y,self.width,self.height)
 
     def _process(self, image, region):
-        h, w, _ = image.shape
-
-        mask = np.full((h, w), 0, dtype=np.uint8)
-        background = np.zeros((h, w), dtype=np.uint8)
-
+        # only landmarks are needed here, the eye crop itself is produced
+        # lazily in getImage() from the eye bounding box
         region_int = np.array(region,dtype=np.int32)
-        cv2.fillPoly(mask, [region_int], 0)
-
-        masked_image = cv2.bitwise_not(background, cv2.cvtColor(
-            image.copy(), cv2.COLOR_BGR2GRAY), mask=mask)
 
         margin = 2
-        min_x = np.min(region_int[:, 0]) - margin
-        max_x = np.max(region_int[:, 0]) + margin
-        min_y = np.min(region_int[:, 1]) - margin
-        max_y = np.max(region_int[:, 1]) + margin
+        region_min_x = np.min(region_int[:, 0])
+        region_max_x = np.max(region_int[:, 0])
+        region_min_y = np.min(region_int[:, 1])
+        region_max_y = np.max(region_int[:, 1])
+        min_x = region_min_x - margin
+        max_x = region_max_x + margin
+        min_y = region_min_y - margin
+        max_y = region_max_y + margin
 
         self.x = min_x
         self.y = min_y
 
-        self.width = np.max(region_int[:, 0]) - np.min(region_int[:, 0])
-        self.height = np.max(region_int[:, 1]) - np.min(region_int[:, 1])
+        self.width = region_max_x - region_min_x
+        self.height = region_max_y - region_min_y
 
         self.center_x = (min_x + max_x)/2
         self.center_y = (min_y + max_y)/2
@@ -175,9 +180,11 @@ class Eye:
             [(max_x - min_x)/2 + min_x,min_y],
         ]
 
+        self.bounds = (min_x, min_y, max_x, max_y)
+        self.cut_image = None
+
         # HACKETY_HACK:
 
-        self.cut_image = masked_image[min_y:max_y, min_x:max_x]
         # print(f"here: {self.cut_image.shape,min_y,max_y,min_x,max_x}")
         # self.cut_image = cv2.cvtColor(self.cut_image, cv2.COLOR_GRAY2BGR)
 
@@ -199,3 +206,16 @@ class Eye:
         # LEGACY
         # org_scale = (max_x - min_x,max_y - min_y)
         # self.pupil = pupil.Pupil(self.cut_image, min_x, min_y, self.scale, org_scale)
+
+    def _cut(self):
+        min_x, min_y, max_x, max_y = self.bounds
+        min_x, min_y = max(int(min_x), 0), max(int(min_y), 0)
+        max_x = min(int(max_x), self.frame.width)
+        max_y = min(int(max_y), self.frame.height)
+
+        if max_x <= min_x or max_y <= min_y:
+            return np.zeros((max(max_y - min_y, 0), max(max_x - min_x, 0)), dtype=np.uint8)
+
+        # a slice of the gray frame when another stage already converted it
+        return self.frame.convert(
+            cv2.COLOR_BGR2GRAY, (min_x, min_y, max_x - min_x, max_y - min_y))
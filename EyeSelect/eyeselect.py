@@ -1,10 +1,16 @@
 import cv2 
 import time
 import uuid
+import asyncio
+import concurrent.futures
+import threading
+import collections
 import numpy as np
-from scipy.spatial.distance import cdist
+from EyeSelect import stats
+from EyeSelect.debug import DebugVisualizer
 from EyeSelect.face import Face, FaceFinder 
-from EyeSelect.utils import VideoCapture
+from EyeSelect.frame import as_frame
+from EyeSelect.utils import VideoCapture, RingBuffer, RunningMedian, DecayingMedian, SpreadTracker
 
 def recoverable(func):
     def inner(*args, **kwargs):
@@ -17,13 +23,11 @@ def recoverable(func):
 def distance(p1, p2):
     return np.linalg.norm(np.array(p1) - np.array(p2))
 
-def compute_std(buffer):
-    if len(buffer) < 2:
-        return (0.0, 0.0)  # Not enough data
-    arr = np.array(buffer)
-    std_x = np.std(arr[:, 0])
-    std_y = np.std(arr[:, 1])
-    return std_x, std_y
+# gestures EventSelector can report
+EVENTS = ("left", "right", "blink", "up")
+
+# event yielded by EyeSelect.stream()
+GestureEvent = collections.namedtuple("GestureEvent", ("gesture", "timestamp", "relaxation"))
 
 class EventSelector:
 
@@ -33,7 +37,8 @@ class EventSelector:
         self.events = dict()
         self.unlatches = dict()
 
-        self.debouncing_start = time.time()
+        # set on the first selection, so frame timestamps can be used
+        self.debouncing_start = None
         self.relaxation = relaxation
         self.last_detection = time.time()
 
@@ -44,8 +49,14 @@ class EventSelector:
         self.unlatches[unique_id] = unlatch
         self.l_registry[unique_id] = False
 
-    def select(self, payload):
-        if self.relaxation > (time.time() - self.debouncing_start):
+    def select(self, payload, timestamp=None):
+        """timestamp of the frame in seconds, current time when None"""
+
+        now = time.time() if timestamp is None else timestamp
+        if self.debouncing_start is None:
+            self.debouncing_start = now
+
+        if self.relaxation > (now - self.debouncing_start):
             return
 
         if self.latched:
@@ -61,67 +72,78 @@ class EventSelector:
                 if ret:
                    self.l_registry[key] = ret
                    self.latched = self.l_registry[key]
-                   self.debouncing_start = time.time()
+                   self.debouncing_start = now
                    break
 
 class EyeBaselineTracker:
-    def __init__(self):
-        # Initialize each baseline as an empty list and baseline median as class attribute
-        self.x_values = []
-        self.y_values = []
-        self.std_x_values = []
-        self.std_y_values = []
-        self.x_y_std_values = []
-        self.d_std_r_values = []
-        self.d_std_l_values = []
-        self.u_std_r_values = []
-        self.u_std_l_values = []
-        self.max_dist_x_values = []
-        self.max_dist_y_values = []
+    """Tracks medians of EyeIntermediateObject fields used as gesture baseline
+
+    By default the median of the whole session is kept. Set window to use only
+    the last `window` frames, or decay to follow an exponentially decaying
+    median estimate, both keep memory and per frame cost constant.
+    """
+
+    FIELDS = (
+        "x",
+        "y",
+        "std_x",
+        "std_y",
+        "x_y_std",
+        "d_std_r",
+        "d_std_l",
+        "u_std_r",
+        "u_std_l",
+        "max_dist_x",
+        "max_dist_y",
+    )
+
+    def __init__(self, window=None, decay=None):
+        if window is not None and decay is not None:
+            raise ValueError("EyeBaselineTracker accepts either window or decay, not both")
+
+        self.window = window
+        self.decay = decay
+
+        if decay is not None:
+            self.estimators = {field: DecayingMedian(decay) for field in self.FIELDS}
+        else:
+            self.estimators = {field: RunningMedian(window) for field in self.FIELDS}
 
         # Baseline medians (can be used directly)
-        self.x = 9999.0
-        self.y = 9999.0
-        self.std_x = 9999.0
-        self.std_y = 9999.0
-        self.x_y_std = 9999.0
-        self.d_std_r = 9999.0
-        self.d_std_l = 9999.0
-        self.u_std_r = 9999.0
-        self.u_std_l = 9999.0
-        self.max_dist_x = 9999.0
-        self.max_dist_y = 9999.0
+        for field in self.FIELDS:
+            setattr(self, field, 9999.0)
 
     def add_obj(self, eio):
-        # Update lists with new values
-        self.x_values.append(eio.x)
-        self.y_values.append(eio.y)
-        self.std_x_values.append(eio.std_x)
-        self.std_y_values.append(eio.std_y)
-        self.x_y_std_values.append(eio.x_y_std)
-        self.d_std_r_values.append(eio.d_std_r)
-        self.d_std_l_values.append(eio.d_std_l)
-        self.u_std_r_values.append(eio.u_std_r)
-        self.u_std_l_values.append(eio.u_std_l)
-        self.max_dist_x_values.append(eio.max_dist_x)
-        self.max_dist_y_values.append(eio.max_dist_y)
-
-
-        # Update medians
-        self.x = np.median(self.x_values)
-        self.y = np.median(self.y_values)
-        self.std_x = np.median(self.std_x_values)
-        self.std_y = np.median(self.std_y_values)
-        self.x_y_std = np.median(self.x_y_std_values)
-        self.d_std_r = np.median(self.d_std_r_values)
-        self.d_std_l = np.median(self.d_std_l_values)
-        self.u_std_r = np.median(self.u_std_r_values)
-        self.u_std_l = np.median(self.u_std_l_values)
-        self.max_dist_x = np.median(self.max_dist_x_values)
-        self.max_dist_y = np.median(self.max_dist_y_values)
+        # Update medians with new values
+        for field, estimator in self.estimators.items():
+            setattr(self, field, estimator.add(getattr(eio, field)))
 
 class EyeIntermediateObject:
 
+    # layout of a single object in numpy feature tables
+    DTYPE = np.dtype([
+        ("x", "f8"),
+        ("y", "f8"),
+        ("std_x", "f8"),
+        ("std_y", "f8"),
+        ("x_y_std", "f8"),
+        ("d_std_r", "f8"),
+        ("d_std_l", "f8"),
+        ("u_std_r", "f8"),
+        ("u_std_l", "f8"),
+        ("left_th", "f8"),
+        ("right_th", "f8"),
+        ("up_th", "f8"),
+        ("blink_th", "f8"),
+        ("l_eye_pupil", "f8", (2,)),
+        ("r_eye_pupil", "f8", (2,)),
+        ("lu", "f8", (2,)),
+        ("ru", "f8", (2,)),
+        ("max_radius", "f8"),
+        ("max_dist_x", "f8"),
+        ("max_dist_y", "f8"),
+    ])
+
     def __init__(self):
         self.x = 0.0
         self.y = 0.0
@@ -144,23 +166,92 @@ class EyeIntermediateObject:
         self.max_dist_x = 0.0
         self.max_dist_y = 0.0
 
+    def toRecord(self, record):
+        """writes fields into a record (or row) of an array with DTYPE"""
+
+        for name in self.DTYPE.names:
+            record[name] = getattr(self, name)
+        return record
+
 class EyeSelect:
 
+    # multipliers and margins of baseline values used by the gesture rules,
+    # can be changed per instance, see EyeSelect.tuning for finding them
+    UNLATCH_MARGIN = 40
+    UP_X_FACTOR = 1.25
+    UP_Y_FACTOR = 1.5
+    UP_STD_FACTOR = 1.5
+    BLINK_STD_FACTOR = 1.5
+    UNLATCH_STD_FACTOR = 1.25
+
+    # highest frame rate time based windows are sized for
+    MAX_FPS = 120
+
     def __init__(self,
                  left_cb = None, 
                  right_cb = None,
                  blink_cb = None,
                  up_cb = None,
-                 verbose = False):
-        self.finder = FaceFinder()
-        self.face = Face()
+                 verbose = False,
+                 window = 20,
+                 baseline_window = None,
+                 baseline_decay = None,
+                 eyes_only = False,
+                 finder = None,
+                 recorder = None,
+                 instrument = False,
+                 dispatcher = None,
+                 publisher = None,
+                 gate = None,
+                 classifier = None,
+                 window_seconds = None):
+        # per stage latencies and counters, see stats()
+        self.metrics = stats.Stats() if instrument else stats.DISABLED
+
+        # tracking mode by default, detection only runs when the face is lost,
+        # finder=False skips loading the model when only landmarks are replayed
+        if finder is None:
+            finder = FaceFinder(static_image_mode=False, metrics=self.metrics)
+        elif finder and finder.metrics is stats.DISABLED:
+            finder.metrics = self.metrics
+        self.finder = finder
+        self.face = Face(eyes_only, self.metrics)
 
         self.verbose = verbose
+        # debug window renders on its own thread, nothing is drawn here.
+        # verbose="sync" draws on the thread calling process() instead (GUI
+        # calls from the main thread only, e.g. macOS), a DebugVisualizer
+        # passed as verbose is used as it is
+        if isinstance(verbose, DebugVisualizer):
+            self.visualizer = verbose
+        elif verbose == "sync":
+            self.visualizer = DebugVisualizer().start(threaded=False)
+        elif verbose:
+            self.visualizer = DebugVisualizer().start()
+        else:
+            self.visualizer = None
         
-        self.l_buffer = []
-        self.r_buffer = []
-        self.u_buffer = []
-        self.d_buffer = []
+        # gesture windows, preallocated and updated in O(1) per frame, with
+        # window_seconds they hold the frames of that many seconds instead of
+        # `window` frames so statistics don't depend on the frame rate
+        self.window_seconds = window_seconds
+        if window_seconds is not None:
+            window = int(np.ceil(window_seconds * self.MAX_FPS))
+        self.l_buffer = RingBuffer(window)
+        self.r_buffer = RingBuffer(window)
+        self.u_buffer = RingBuffer(window)
+        self.d_buffer = RingBuffer(window)
+        # spread of both pupils over the same window
+        self.spread = SpreadTracker(window)
+
+        # callbacks run on dispatch.CallbackDispatcher threads when given,
+        # so they can't delay processing of the next frame
+        self.dispatcher = dispatcher
+        if dispatcher is not None:
+            left_cb = dispatcher.wrap("left", left_cb)
+            right_cb = dispatcher.wrap("right", right_cb)
+            blink_cb = dispatcher.wrap("blink", blink_cb)
+            up_cb = dispatcher.wrap("up", up_cb)
 
         self.left_cb = left_cb
         self.right_cb = right_cb
@@ -172,39 +263,191 @@ class EyeSelect:
 
         self.relaxation_tracker = 0.0
 
+        self.unlatch_margin = self.UNLATCH_MARGIN
+        self.up_x_factor = self.UP_X_FACTOR
+        self.up_y_factor = self.UP_Y_FACTOR
+        self.up_std_factor = self.UP_STD_FACTOR
+        self.blink_std_factor = self.BLINK_STD_FACTOR
+        self.unlatch_std_factor = self.UNLATCH_STD_FACTOR
+
+        # classifier.GestureClassifier replacing the rule based detectors
+        self.classifier = classifier
+        self.listeners = []
+        self.__register(left_cb is not None, right_cb is not None,
+                        blink_cb is not None, up_cb is not None)
+
+        self.baseline = EyeBaselineTracker(baseline_window, baseline_decay)
+        self.eio = None
+        self.recorder = recorder
+        # publish.Publisher receiving features and event of every frame
+        self.publisher = publisher
+        # gesture detected in the last processed frame
+        self.gesture = None
+        # gate.MotionGate skipping inference while nobody is around
+        self.gate = gate
+
+    def __register(self, left, right, blink, up):
+        """enables the detector of every gesture that has a callback"""
+
         self.eventSelector = EventSelector()
-        if left_cb is not None:
+        if self.classifier is not None:
+            self.eventSelector.register(self.__classified, self.__classified_unlatch)
+            return
+        if right:
             self.eventSelector.register(self.__right, self.__right_unlatch)
-        if right_cb is not None:
+        if left:
             self.eventSelector.register(self.__left, self.__left_unlatch)
-        if blink_cb is not None:
+        if up:
             self.eventSelector.register(self.__up, self.__up_unlatch)
-        if up_cb is not None:
+        if blink:
             self.eventSelector.register(self.__blink, self.__blink_unlatch)
 
-        self.baseline = EyeBaselineTracker()
+    def listen(self, listener):
+        """calls listener(gesture) on every detected gesture, besides the
+        callbacks. All gestures get detected from now on, even those without
+        a callback, latch state is reset when detectors had to be added."""
+
+        if self.classifier is None and len(self.eventSelector.events) < 4:
+            self.__register(True, True, True, True)
+        self.listeners.append(listener)
+
+    def unlisten(self, listener):
+        self.listeners.remove(listener)
+
+    def _emit(self, gesture, callback):
+        self.gesture = gesture
+        if callback is not None:
+            callback()
+        for listener in self.listeners:
+            listener(gesture)
+        self.metrics.count("events")
+        self.metrics.count(f"events_{gesture}")
+
+    async def stream(self, source=0, queue_size=8, executor=None, **thresholds):
+        """Yields GestureEvent of gestures detected on a source
+
+            async for event in ekeys.stream(0, left_th=-50):
+                print(event.gesture, event.timestamp)
+
+        Capture (utils.VideoCapture for camera indices and paths, or any
+        object with its read()) and process() run in `executor`, the event
+        loop only waits for events. Up to queue_size events wait for a slow
+        consumer, then processing blocks until the consumer catches up; live
+        cameras keep only their latest frame meanwhile. Wrap it in
+        contextlib.aclosing() to stop capture right when leaving the loop
+        early.
+        """
+
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue(queue_size)
+        stop = threading.Event()
+        detected = []
+
+        if isinstance(source, (int, str)):
+            # paths are finite, none of their frames may be dropped
+            cap = VideoCapture(source, bufforless=isinstance(source, int))
+        else:
+            cap = source
+
+        def put(item):
+            try:
+                # blocks while the queue is full
+                asyncio.run_coroutine_threadsafe(events.put(item), loop).result()
+                return True
+            except (RuntimeError, concurrent.futures.CancelledError):
+                # event loop closed or shutting down
+                return False
+
+        def produce():
+            try:
+                while not stop.is_set():
+                    ret, frame = cap.read()
+                    if frame is None:
+                        break
+
+                    timestamp = getattr(cap, "timestamp", None)
+                    if timestamp is None:
+                        timestamp = time.time()
+
+                    del detected[:]
+                    relaxation = self.process(frame, timestamp=timestamp, **thresholds)
+                    for gesture in detected:
+                        if not put(GestureEvent(gesture, timestamp, relaxation)):
+                            return
+
+                    if not ret:
+                        break
+            finally:
+                put(None)
+
+        self.listen(detected.append)
+        producer = loop.run_in_executor(executor, produce)
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
+            # raises exceptions of capture or processing
+            await producer
+        finally:
+            stop.set()
+            # unblock the producer if it waits for space in the queue
+            while not producer.done():
+                while not events.empty():
+                    events.get_nowait()
+                await asyncio.wait({producer}, timeout=0.05)
+            self.unlisten(detected.append)
+            if cap is not source:
+                cap.close()
+
+    def stats(self):
+        """counters (frames, faces, no_face, events, exceptions) and latency
+        histograms of every stage in seconds, empty unless instrument=True"""
+
+        return self.metrics.snapshot()
+
+    def close(self):
+        """stops the debug window thread"""
+
+        if self.visualizer is not None:
+            self.visualizer.stop()
 
     def post_detection(self):
-        for _ in range(len(self.l_buffer)):
-            self.l_buffer.pop(0)
-            self.r_buffer.pop(0)
-        
-        for _ in range(len(self.u_buffer)):
-            self.u_buffer.pop(0)
-            self.d_buffer.pop(0)
+        self.l_buffer.clear()
+        self.r_buffer.clear()
+        self.u_buffer.clear()
+        self.d_buffer.clear()
+        self.spread.clear()
+        if self.classifier is not None:
+            self.classifier.clear()
+
+    def __classified(self, eio : EyeIntermediateObject):
+        gesture = self.classifier.gesture()
+        if gesture is not None:
+            self._emit(gesture, getattr(self, f"{gesture}_cb"))
+            self.post_detection()
+            return True
+
+    def __classified_unlatch(self, eio : EyeIntermediateObject):
+        # below zero once no gesture is confident any more
+        self.relaxation_tracker = float(self.classifier.probabilities[1:].max()) - self.classifier.threshold
+        if self.classifier.gesture() is None:
+            return False
 
     def __left(self, eio : EyeIntermediateObject):
         if (eio.std_x > self.baseline.std_x and eio.x < eio.left_th + self.baseline.x):
             self.debouncing_start = time.time()
             self.debouncing = True
-            self.left_cb()
+            self._emit("left", self.left_cb)
             self.post_detection()
             return True
 
     def __left_unlatch(self,eio : EyeIntermediateObject):
 
-        self.relaxation_tracker = (eio.std_x - self.baseline.std_x)/self.baseline.std_x + (eio.x - (eio.left_th + 40))/(eio.left_th + 40) 
-        if (eio.std_x < self.baseline.std_x and eio.x > eio.left_th + self.baseline.x + 40):
+        margin = self.unlatch_margin
+        self.relaxation_tracker = (eio.std_x - self.baseline.std_x)/self.baseline.std_x + (eio.x - (eio.left_th + margin))/(eio.left_th + margin) 
+        if (eio.std_x < self.baseline.std_x and eio.x > eio.left_th + self.baseline.x + margin):
             return False
         
 
@@ -213,54 +456,110 @@ class EyeSelect:
         if (eio.std_x > self.baseline.std_x and eio.x > eio.right_th + self.baseline.x):
             self.debouncing_start = time.time()
             self.debouncing = True
-            self.right_cb()
+            self._emit("right", self.right_cb)
             self.post_detection()
             return True
 
     def __right_unlatch(self,eio : EyeIntermediateObject):
 
-        self.relaxation_tracker = (eio.std_x - self.baseline.std_x)/self.baseline.std_x + (eio.x - (eio.right_th + 40))/(eio.right_th + 40) 
-        if (eio.std_x < self.baseline.std_x and eio.x < (eio.right_th + self.baseline.x - 40)):
+        margin = self.unlatch_margin
+        self.relaxation_tracker = (eio.std_x - self.baseline.std_x)/self.baseline.std_x + (eio.x - (eio.right_th + margin))/(eio.right_th + margin) 
+        if (eio.std_x < self.baseline.std_x and eio.x < (eio.right_th + self.baseline.x - margin)):
             return False
 
     def __up(self, eio : EyeIntermediateObject):
 
-        if ( eio.max_dist_x < self.baseline.max_dist_x * 1.25 and eio.max_dist_y > self.baseline.max_dist_y * 1.5 and eio.std_y > self.baseline.std_y * 1.5):
+        if ( eio.max_dist_x < self.baseline.max_dist_x * self.up_x_factor and eio.max_dist_y > self.baseline.max_dist_y * self.up_y_factor and eio.std_y > self.baseline.std_y * self.up_std_factor):
             self.debouncing_start = time.time()
-            self.up_cb()
+            self._emit("up", self.up_cb)
             self.post_detection()
             return True
 
     def __up_unlatch(self,eio : EyeIntermediateObject):
 
-        self.relaxation_tracker = (eio.std_y - (self.baseline.std_y * 1.25))/(self.baseline.std_y * 1.25)
-        if eio.std_y < self.baseline.std_y * 1.25:
+        factor = self.unlatch_std_factor
+        self.relaxation_tracker = (eio.std_y - (self.baseline.std_y * factor))/(self.baseline.std_y * factor)
+        if eio.std_y < self.baseline.std_y * factor:
             return False
 
     def __blink(self, eio : EyeIntermediateObject):
-        if (eio.max_radius > eio.blink_th and eio.std_x > self.baseline.std_x * 1.5 and eio.std_y > self.baseline.std_y * 1.5):
+        if (eio.max_radius > eio.blink_th and eio.std_x > self.baseline.std_x * self.blink_std_factor and eio.std_y > self.baseline.std_y * self.blink_std_factor):
             self.debouncing_start = time.time()
             self.debouncing = True
-            self.blink_cb()
+            self._emit("blink", self.blink_cb)
             self.post_detection()
             return True
 
     def __blink_unlatch(self,eio : EyeIntermediateObject):
         
-        self.relaxation_tracker = (eio.std_y - (self.baseline.std_y * 1.25))/(self.baseline.std_y * 1.25)
-        if eio.std_y < self.baseline.std_y * 1.25:
+        factor = self.unlatch_std_factor
+        self.relaxation_tracker = (eio.std_y - (self.baseline.std_y * factor))/(self.baseline.std_y * factor)
+        if eio.std_y < self.baseline.std_y * factor:
             return False
 
     # @recoverable
-    def process(self,image,left_th=-100, right_th=100, up_th=1.5, blink_th=100):
-
-        x_y_std = 40 # std deviation thershold for x_y move
+    def process(self,image,left_th=-100, right_th=100, up_th=1.5, blink_th=100, timestamp=None):
+        """timestamp of the frame in seconds, wall clock is used when None,
+        image is a BGR array or a frame.Frame shared by every stage"""
+
+        start = self.metrics.start()
+        self.metrics.count("frames")
+        frame = as_frame(image, timestamp)
+        if timestamp is None:
+            timestamp = frame.timestamp
+
+        if self.gate is not None and not self.gate.check(frame):
+            self.metrics.count("skipped")
+            return None
 
-        face_mesh = self.finder.find(image)
+        face_mesh = self.finder.find(frame)
+        if self.gate is not None:
+            self.gate.update(bool(face_mesh))
         if not face_mesh:
+            self.metrics.count("no_face")
+            if self.recorder is not None:
+                self.recorder.write(None, frame.shape, timestamp)
+            if self.publisher is not None:
+                self.publisher.write(None, time.time() if timestamp is None else timestamp)
             return None
 
-        self.face.process(image, face_mesh)
+        relaxation_tracker = self.process_face(frame, face_mesh, self.finder.roi,
+                                               left_th, right_th, up_th, blink_th, timestamp)
+        self.finder.update(self.face.getBoundingBox())
+        self.metrics.stop("process", start)
+        return relaxation_tracker
+
+    def process_face(self, image, face_mesh, roi=None, left_th=-100, right_th=100, up_th=1.5, blink_th=100, timestamp=None, index=0):
+        """part of process() following face detection, computes features of
+        the frame and runs gesture selection on them, index selects the face
+        of a multi face result
+
+        The finder isn't updated here, its state belongs to whoever calls
+        find(), the face box is self.face.getBoundingBox()."""
+
+        self.face.process(image, face_mesh, roi, index)
+
+        if self.recorder is not None:
+            self.recorder.write(self.face.getLandmarks(), image.shape, timestamp)
+
+        return self._process_features(left_th, right_th, up_th, blink_th, timestamp)
+
+    def process_landmarks(self, landmarks, left_th=-100, right_th=100, up_th=1.5, blink_th=100, timestamp=None, image=None):
+        """runs gesture selection on face landmarks in pixel coordinates
+        without an image or face detection, e.g. replayed from a recording"""
+
+        self.metrics.count("frames")
+        self.face.processLandmarks(landmarks, image)
+        return self._process_features(left_th, right_th, up_th, blink_th, timestamp)
+
+    def _process_features(self, left_th, right_th, up_th, blink_th, timestamp):
+
+        start = self.metrics.start()
+        self.metrics.count("faces")
+        self.gesture = None
+        now = time.time() if timestamp is None else timestamp
+
+        x_y_std = 40 # std deviation thershold for x_y move
 
         # face_landmarks = self.face.getLandmarks()
         l_eye = self.face.getLeftEye()
@@ -286,39 +585,30 @@ class EyeSelect:
         # Window size
         width, height = 1000, 1000
 
-        # Dot position and size
+        # Dot position
         l_dot_position = (lx*width, ly*height)  # (x, y)
         r_dot_position = (rx*width, ry*height)  # (x, y)
-        dot_radius = 5
-        # dot_color = (0, 0, 255)  # Red in BGR
-        background_color = (255, 255, 255)  # White
 
-        # Create a white background image
-        image = np.full((height, width, 3), background_color, dtype=np.uint8)
         # Ensure coordinates are integers
         if l_dot_position is not None and r_dot_position is not None:
             l_dot_position = (int(l_dot_position[0]), int(l_dot_position[1]))
             r_dot_position = (int(r_dot_position[0]), int(r_dot_position[1]))
-            self.l_buffer.append(l_dot_position)
-            self.r_buffer.append(r_dot_position)
-
-            if len(self.r_buffer) > 20:
-                self.r_buffer.pop(0)
-                self.l_buffer.pop(0)
-
-            if self.verbose:
-                for n in range(len(self.r_buffer)):
-                    cv2.circle(image, self.l_buffer[n], dot_radius, (0, 0, 255), -1)
-                    cv2.circle(image, self.r_buffer[n], dot_radius, (255, 0, 0), -1)
-
-                # Display the image
-                cv2.imshow("Dot Display", image)
-
-                # Wait until a key is pressed
-                cv2.waitKey(1)
-
-        l_std_x, l_std_y = compute_std(self.l_buffer)
-        r_std_x, r_std_y = compute_std(self.r_buffer)
+            self.l_buffer.add(l_dot_position, now)
+            self.r_buffer.add(r_dot_position, now)
+            self.spread.add((l_dot_position, r_dot_position), now)
+            if self.window_seconds is not None:
+                before = now - self.window_seconds
+                self.l_buffer.expire(before)
+                self.r_buffer.expire(before)
+                self.spread.expire(before)
+
+            if self.visualizer is not None:
+                self.visualizer.update(self.l_buffer.values(), self.r_buffer.values())
+                if self.verbose == "sync":
+                    self.visualizer.render()
+
+        l_std_x, l_std_y = self.l_buffer.std()
+        r_std_x, r_std_y = self.r_buffer.std()
 
         
         x = ((int(l_dot_position[0]) - width/2) + (int(r_dot_position[0]) - width/2))/2
@@ -327,30 +617,22 @@ class EyeSelect:
         std_x = (l_std_x + r_std_x)/2
         std_y = (l_std_y + r_std_y)/2
 
-        self.u_buffer.append((distance(l_eye_pupil,lu)/distance(ld,lu),distance(r_eye_pupil,ru)/distance(rd,ru)))
-        self.d_buffer.append((distance(l_eye_pupil,ld)/distance(ld,lu),distance(r_eye_pupil,rd)/distance(rd,ru)))
-        u_std_r, u_std_l = compute_std(self.u_buffer)
-        d_std_r, d_std_l = compute_std(self.d_buffer)
+        self.u_buffer.add((distance(l_eye_pupil,lu)/distance(ld,lu),distance(r_eye_pupil,ru)/distance(rd,ru)), now)
+        self.d_buffer.add((distance(l_eye_pupil,ld)/distance(ld,lu),distance(r_eye_pupil,rd)/distance(rd,ru)), now)
+        if self.window_seconds is not None:
+            self.u_buffer.expire(now - self.window_seconds)
+            self.d_buffer.expire(now - self.window_seconds)
+        u_std_r, u_std_l = self.u_buffer.std()
+        d_std_r, d_std_l = self.d_buffer.std()
 
         if (u_std_r + u_std_l)/2 <= 0.02 and (self.debouncing):
             self.baseline_y_u = (distance(l_eye_pupil,lu) + distance(r_eye_pupil,ru))/2
 
-        if len(self.d_buffer) > 20:
-            self.u_buffer.pop(0)
-            self.d_buffer.pop(0)
-
-        max_radius = 0.0
-
-        all_points = np.concatenate((self.l_buffer, self.r_buffer))
-        distances = cdist(all_points, all_points)  # Shape: (len(a), len(b))
-        max_radius = np.max(distances)
+        # Largest distance between pupil positions in the window
+        max_radius = self.spread.diameter()
 
-        # Max absolute difference in X
-        max_dist_x = all_points[:, 0].max() - all_points[:, 0].min()  # shape broadcasted to (len(a), len(b))
-        # Max absolute difference in Y
-        max_dist_y = all_points[:, 1].max() - all_points[:, 1].min()
-        max_radius = np.max(distances)
-        max_radius = np.max(distances)
+        # Max absolute difference in X and Y
+        max_dist_x, max_dist_y = self.spread.range()
 
 
         eio = EyeIntermediateObject()
@@ -374,9 +656,22 @@ class EyeSelect:
         eio.max_radius = max_radius
         eio.max_dist_x = max_dist_x
         eio.max_dist_y = max_dist_y
+        self.eio = eio
+        self.metrics.stop("features", start)
 
-        self.eventSelector.select(eio)
+        if self.classifier is not None:
+            self.classifier.add(eio)
+
+        start = self.metrics.start()
+        self.eventSelector.select(eio, timestamp)
+        self.metrics.stop("select", start)
+
+        start = self.metrics.start()
         self.baseline.add_obj(eio)
+        self.metrics.stop("baseline", start)
+
+        if self.publisher is not None:
+            self.publisher.write(eio, time.time() if timestamp is None else timestamp, self.gesture)
 
         # print(f"Eye std: u_std_r={u_std_r:.2f}, u_std_l={u_std_l:.2f} dist_u={(distance(l_eye_pupil,lu) + distance(r_eye_pupil,ru))/2:.2f} d_std_r={d_std_r:.2f}, d_std_l={d_std_l:.2f} dist_d={(distance(l_eye_pupil,ld) + distance(r_eye_pupil,rd))/2:.2f}")
 
@@ -1,49 +1,297 @@
 """Module providing finding and extraction of face from image."""
 
+import itertools
+
 import cv2
 import numpy as np
 import mediapipe as mp
 import EyeSelect.eye as eye
+from EyeSelect import stats
+from EyeSelect.frame import as_frame
+
+# wire layout of a serialized NormalizedLandmark holding only x, y and z,
+# lets a whole landmark list be decoded with a single numpy call
+_WIRE_LANDMARK = np.dtype([
+    ("tag", "u1"),
+    ("size", "u1"),
+    ("x_tag", "u1"),
+    ("x", "<f4"),
+    ("y_tag", "u1"),
+    ("y", "<f4"),
+    ("z_tag", "u1"),
+    ("z", "<f4"),
+])
+
+
+def _decode_landmarks(landmark_list):
+    """decode NormalizedLandmarkList in bulk, None if layout is different"""
+
+    if not hasattr(landmark_list, "SerializeToString"):
+        return None
+
+    data = landmark_list.SerializeToString()
+    if len(data) != len(landmark_list.landmark) * _WIRE_LANDMARK.itemsize:
+        return None
+
+    decoded = np.frombuffer(data, dtype=_WIRE_LANDMARK)
+    if not (np.all(decoded["tag"] == 0x0A) and np.all(decoded["size"] == 0x0F) and
+            np.all(decoded["x_tag"] == 0x0D) and np.all(decoded["y_tag"] == 0x15)):
+        return None
+
+    return decoded
+
+
+def landmark_box(face, index, width, height, roi=None):
+    """(x, y, width, height) of face `index` of a face mesh result in pixels
+    of a width x height frame, without converting every landmark"""
+
+    landmark_list = face.multi_face_landmarks[index]
+    decoded = _decode_landmarks(landmark_list)
+    if decoded is not None:
+        xs = decoded["x"]
+        ys = decoded["y"]
+        min_x, max_x, min_y, max_y = xs.min(), xs.max(), ys.min(), ys.max()
+    else:
+        xs = [landmark.x for landmark in landmark_list.landmark]
+        ys = [landmark.y for landmark in landmark_list.landmark]
+        min_x, max_x, min_y, max_y = min(xs), max(xs), min(ys), max(ys)
+
+    if roi is None:
+        x, y, w, h = 0, 0, width, height
+    else:
+        x, y, w, h = roi
+
+    min_x = x + min_x * w
+    max_x = x + max_x * w
+    min_y = y + min_y * h
+    max_y = y + max_y * h
+    return (int(min_x), int(min_y), int(max_x - min_x), int(max_y - min_y))
 
 
 class FaceFinder:
+    """MediaPipe face mesh wrapper
+
+    With static_image_mode=False face detection runs only when the face was
+    lost and landmarks are tracked from the previous frame otherwise, tracking
+    is dropped when its confidence falls below min_tracking_confidence.
+    redetect_interval forces a full detection every N frames (0 disables it).
+
+    With crop_margin set inference runs only on a region around the last face
+    box, grown by crop_margin times the box size on every side, and falls back
+    to the full frame when the face is lost. inference_size limits the longer
+    side of the image passed to MediaPipe. Landmarks are normalized to `roi`
+    (x, y, width, height in the full frame, None for the whole frame).
+
+    max_num_faces faces are found by a single inference, see
+    multiface.MultiFaceEyeSelect.
 
-    def __init__(self, static_image_mode=True):
-        self.mp_face_mesh = mp.solutions.face_mesh.FaceMesh(
+    metrics is a stats.Stats receiving `find` latency and inference
+    exception counts, EyeSelect attaches its own when none is given.
+    """
+
+    def __init__(self, static_image_mode=True, redetect_interval=0,
+                 min_detection_confidence=0.5, min_tracking_confidence=0.5,
+                 crop_margin=None, inference_size=None, metrics=None,
+                 max_num_faces=1):
+        self.static_image_mode = static_image_mode
+        self.redetect_interval = redetect_interval
+        self.crop_margin = crop_margin
+        self.inference_size = inference_size
+        self.max_num_faces = max_num_faces
+        self.metrics = stats.DISABLED if metrics is None else metrics
+        self.mp_face_mesh = self._create_mesh(
+            min_detection_confidence, min_tracking_confidence)
+
+        self.tracking = False
+        self.last_box = None
+        self.roi = None
+        self.frames = 0
+        self.detections = 0
+        self.since_detection = 0
+        self.fallbacks = 0
+        self.__crop_size = 0
+
+    def _create_mesh(self, min_detection_confidence, min_tracking_confidence):
+        return mp.solutions.face_mesh.FaceMesh(
             refine_landmarks=True,
-            static_image_mode=static_image_mode,
-            min_detection_confidence=0.5,
-            min_tracking_confidence=0.5
+            max_num_faces=self.max_num_faces,
+            static_image_mode=self.static_image_mode,
+            min_detection_confidence=min_detection_confidence,
+            min_tracking_confidence=min_tracking_confidence
         )
 
+    def _infer(self, rgb):
+        """runs the face mesh graph on an RGB image"""
+
+        return self.mp_face_mesh.process(rgb)
+
     def find(self, image):
+        """returns face mesh result or None when no face was found, image is
+        a BGR array or a frame.Frame"""
 
-        assert (len(image.shape) > 2)
+        frame = as_frame(image)
+        assert (len(frame.shape) > 2)
 
-        try:
-            face_mesh = self.mp_face_mesh.process(
-                cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        start = self.metrics.start()
+        roi = self._region(frame.width, frame.height)
+        face_mesh = self._run(frame, roi)
+
+        if face_mesh is None and roi is not None:
+            # face lost inside the crop, retry on the full frame
+            self.fallbacks += 1
+            roi = None
+            face_mesh = self._run(frame, roi)
+
+        if face_mesh is None:
+            self.last_box = None
+
+        self.metrics.stop("find", start)
+        return face_mesh
+
+    def _region(self, w, h):
+        """region of the frame to run inference on, None for the full frame"""
+
+        if self.crop_margin is None or self.last_box is None:
+            return None
+
+        x, y, box_w, box_h = self.last_box
+        size = max(box_w, box_h)
+
+        # keep previous region while the face stays well inside of it, a
+        # steady input lets MediaPipe keep tracking instead of re-detecting
+        if self.roi is not None and size > 0:
+            roi_x, roi_y, roi_w, roi_h = self.roi
+            slack = self.crop_margin * size / 2
+            if (x - slack >= roi_x and y - slack >= roi_y and
+                    x + box_w + slack <= roi_x + roi_w and
+                    y + box_h + slack <= roi_y + roi_h and
+                    size > self.__crop_size / 2):
+                return self.roi
+
+        side = int(size * (1 + 2 * self.crop_margin))
+        center_x = x + box_w / 2
+        center_y = y + box_h / 2
 
-            return face_mesh
+        min_x = max(int(center_x - side / 2), 0)
+        min_y = max(int(center_y - side / 2), 0)
+        max_x = min(int(center_x + side / 2), w)
+        max_y = min(int(center_y + side / 2), h)
+
+        if max_x <= min_x or max_y <= min_y:
+            return None
+
+        # not worth cropping when the region covers most of the frame
+        if (max_x - min_x) * (max_y - min_y) > 0.8 * w * h:
+            return None
+
+        self.__crop_size = size
+        return (min_x, min_y, max_x - min_x, max_y - min_y)
+
+    def _run(self, frame, roi):
+        if self.tracking and not self.static_image_mode and roi != self.roi:
+            # tracked face position is relative to the previous input region
+            self.mp_face_mesh.reset()
+            self.tracking = False
+
+        if self.tracking and self.redetect_interval and \
+                self.since_detection >= self.redetect_interval:
+            # drop tracked state so the next inference runs full detection
+            self.mp_face_mesh.reset()
+            self.tracking = False
+
+        self.roi = roi
+        detection = not self.tracking
+
+        try:
+            face_mesh = self._infer(
+                frame.convert(cv2.COLOR_BGR2RGB, roi, self.inference_size))
         except Exception as e:
             print(f"Exception in FaceFinder: {e}")
+            self.metrics.count("finder_exceptions")
+            self.tracking = False
+            return None
+
+        self.frames += 1
+        if detection:
+            self.detections += 1
+            self.since_detection = 0
+        else:
+            self.since_detection += 1
+
+        if not face_mesh.multi_face_landmarks:
+            self.tracking = False
             return None
 
+        self.tracking = not self.static_image_mode
+        return face_mesh
+
+    def reset(self):
+        """forgets tracked face, the next frame runs full detection"""
+
+        if self.mp_face_mesh is not None:
+            self.mp_face_mesh.reset()
+        self.tracking = False
+        self.last_box = None
+        self.roi = None
+
+    def update(self, box):
+        """stores bounding box of the face found in the last frame"""
+
+        self.last_box = box
+
+    def getState(self):
+        """detections counts inferences this wrapper started without tracked
+        state (first frame, face lost, redetect_interval, reset() or a new
+        crop region). MediaPipe's own re-detections after its tracking
+        confidence drops happen inside the graph and are not counted, so it
+        is a lower bound, since_detection counts frames since such a start"""
+
+        return {
+            "tracking": self.tracking,
+            "last_box": self.last_box,
+            "frames": self.frames,
+            "detections": self.detections,
+            "since_detection": self.since_detection,
+            "roi": self.roi,
+            "fallbacks": self.fallbacks,
+        }
+
 
 class Face:
 
-    def __init__(self):
+    FACE_OVAL_KEYPOINTS = np.array(
+        list(mp.solutions.face_mesh.FACEMESH_FACE_OVAL))[:, 0]
+
+    # landmarks converted in eyes only mode, face oval is kept so that
+    # getBoundingBox still describes the whole face
+    EYES_ONLY_KEYPOINTS = np.unique(np.concatenate((
+        eye.Eye.LEFT_EYE_KEYPOINTS,
+        eye.Eye.RIGHT_EYE_KEYPOINTS,
+        eye.Eye.LEFT_EYE_PUPIL_KEYPOINT,
+        eye.Eye.RIGHT_EYE_PUPIL_KEYPOINT,
+        FACE_OVAL_KEYPOINTS)))
+
+    def __init__(self, eyes_only=False, metrics=None):
+        self.metrics = stats.DISABLED if metrics is None else metrics
         self.eyeLeft = eye.Eye(0)
         self.eyeRight = eye.Eye(1)
+        self.eyes_only = eyes_only
+        self.roi = None
         self.landmarks = None
+        self.__landmarks = None
 
     def getBoundingBox(self):
         if self.landmarks is not None:
+            if self.eyes_only:
+                points = self.landmarks[self.EYES_ONLY_KEYPOINTS]
+            else:
+                points = self.landmarks
+
             margin = 0
-            min_x = np.min(self.landmarks[:, 0]) - margin
-            max_x = np.max(self.landmarks[:, 0]) + margin
-            min_y = np.min(self.landmarks[:, 1]) - margin
-            max_y = np.max(self.landmarks[:, 1]) + margin
+            min_x = np.min(points[:, 0]) - margin
+            max_x = np.max(points[:, 0]) + margin
+            min_y = np.min(points[:, 1]) - margin
+            max_y = np.max(points[:, 1]) + margin
 
             width = int((max_x - min_x))
             height = int((max_y - min_y))
@@ -61,31 +309,80 @@ class Face:
     def getLandmarks(self):
         return self.landmarks
 
-    def _landmarks(self, face):
+    def _landmarks(self, face, index=0):
+        """convert landmarks of face `index` to pixel coordinates in a
+        preallocated array, in eyes only mode rows outside
+        EYES_ONLY_KEYPOINTS are left stale"""
 
         __complex_landmark_points = face.multi_face_landmarks
-        __complex_landmarks = __complex_landmark_points[0].landmark
+        __complex_landmark_list = __complex_landmark_points[index]
+        __complex_landmarks = __complex_landmark_list.landmark
+        count = len(__complex_landmarks)
+
+        if self.__landmarks is None or len(self.__landmarks) != count:
+            self.__landmarks = np.zeros((count, 2), dtype=np.float32)
+        __face_landmarks = self.__landmarks
 
-        __face_landmarks = []
-        for landmark in __complex_landmarks:
-            __face_landmarks.append((
-                landmark.x * self.image_w,
-                landmark.y * self.image_h))
+        indices = self.EYES_ONLY_KEYPOINTS if self.eyes_only else slice(None)
+        decoded = _decode_landmarks(__complex_landmark_list)
 
-        return np.array(__face_landmarks)
+        if decoded is not None:
+            __face_landmarks[indices, 0] = decoded["x"][indices]
+            __face_landmarks[indices, 1] = decoded["y"][indices]
+        elif self.eyes_only:
+            __face_landmarks[indices] = [
+                (__complex_landmarks[i].x, __complex_landmarks[i].y)
+                for i in self.EYES_ONLY_KEYPOINTS.tolist()]
+        else:
+            __face_landmarks[:] = np.fromiter(
+                itertools.chain.from_iterable(
+                    (landmark.x, landmark.y) for landmark in __complex_landmarks),
+                dtype=np.float32, count=2 * count).reshape(count, 2)
 
-    def process(self, image, face):
+        if self.roi is None:
+            __face_landmarks[indices] *= (self.image_w, self.image_h)
+        else:
+            # landmarks are normalized to the inference region
+            x, y, w, h = self.roi
+            __face_landmarks[indices] *= (w, h)
+            __face_landmarks[indices] += (x, y)
+        return __face_landmarks
+
+    def process(self, image, face, roi=None, index=0):
+        """image is a BGR array or a frame.Frame"""
+
+        start = self.metrics.start()
         try:
+            frame = as_frame(image)
             self.face = face
-            self.image_h, self.image_w, _ = image.shape
-            self.landmarks = self._landmarks(self.face)
+            self.roi = roi
+            self.image_h, self.image_w = frame.height, frame.width
+            self.landmarks = self._landmarks(self.face, index)
             # self.nose = nose.Nose(image,self.landmarks,self.getBoundingBox())
 
-            x, y, _, _ = self.getBoundingBox()
-            offset = np.array((x, y))
-            # offset = offset - self.nose.getHeadTiltOffset()
+            self._update(frame)
+        except Exception as e:
+            print(f"Caught exception: {e}")
+            self.metrics.count("face_exceptions")
+        self.metrics.stop("face", start)
+
+    def processLandmarks(self, landmarks, image=None):
+        """updates face from landmarks already in pixel coordinates, e.g.
+        replayed from a recording, image is only needed for eye crops"""
 
-            self.eyeLeft.update(image, self.landmarks, offset)
-            self.eyeRight.update(image, self.landmarks, offset)
+        try:
+            self.landmarks = landmarks
+            self._update(as_frame(image))
         except Exception as e:
-            print(f"Caught exception: {e}")
\ No newline at end of file
+            print(f"Caught exception: {e}")
+            self.metrics.count("face_exceptions")
+
+    def _update(self, frame):
+        x, y, _, _ = self.getBoundingBox()
+        offset = np.array((x, y))
+        # offset = offset - self.nose.getHeadTiltOffset()
+
+        start = self.metrics.start()
+        self.eyeLeft.update(frame, self.landmarks, offset)
+        self.eyeRight.update(frame, self.landmarks, offset)
+        self.metrics.stop("eyes", start)
\ No newline at end of file
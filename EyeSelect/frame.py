@@ -0,0 +1,94 @@
+"""Module providing a frame shared by the processing stages."""
+
+import cv2
+
+
+class Frame:
+    """BGR camera frame with its size, timestamp and cached conversions
+
+    convert() produces color converted, cropped and downscaled versions of
+    the image, each one at most once per frame, so stages asking for the
+    same version (e.g. RGB for the face model, gray for both eye crops)
+    share a single pass over the pixels.
+    """
+
+    def __init__(self, image, timestamp=None):
+        self.image = image
+        self.timestamp = timestamp
+        self.shape = image.shape
+        self.height, self.width = image.shape[:2]
+        self.__cache = {}
+
+    def convert(self, code=None, roi=None, size=None):
+        """image converted with cv2 color code (None keeps BGR), cut to roi
+        (x, y, width, height) and downscaled so that its longer side is at
+        most size pixels
+
+        Without downscaling a region of an already converted full frame is a
+        view into it. Otherwise the region is cut before it is resized and
+        converted, so only its pixels are touched.
+        """
+
+        key = (code, roi, size)
+        if key in self.__cache:
+            return self.__cache[key]
+
+        full = self.__cache.get((code, None, None))
+        if full is not None and size is None:
+            x, y, w, h = roi
+            return full[y:y + h, x:x + w]
+
+        image = self.image
+        if roi is not None:
+            x, y, w, h = roi
+            image = image[y:y + h, x:x + w]
+
+        if size is not None:
+            h, w = image.shape[:2]
+            scale = size / max(w, h)
+            if scale < 1.0:
+                image = cv2.resize(
+                    image, (max(int(w * scale), 1), max(int(h * scale), 1)),
+                    interpolation=cv2.INTER_AREA)
+
+        if code is not None and image.size:
+            image = cv2.cvtColor(image, code)
+
+        self.__cache[key] = image
+        return image
+
+    def getRGB(self):
+        return self.convert(cv2.COLOR_BGR2RGB)
+
+    def getGray(self):
+        return self.convert(cv2.COLOR_BGR2GRAY)
+
+    def getThumbnail(self, size):
+        """gray image of exactly size (width, height), sampled from a
+        strided view so only few pixels are converted, meant for cheap whole
+        frame comparisons like motion detection"""
+
+        key = ("thumbnail", size)
+        if key in self.__cache:
+            return self.__cache[key]
+
+        step = max(min(self.width // size[0], self.height // size[1]) // 2, 1)
+        gray = self.__cache.get((cv2.COLOR_BGR2GRAY, None, None))
+        if gray is not None:
+            image = gray[::step, ::step]
+        else:
+            image = self.image[::step, ::step]
+            if image.ndim == 3:
+                image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+        self.__cache[key] = image
+        return image
+
+
+def as_frame(image, timestamp=None):
+    """Frame of image, Frames and None are returned as they are"""
+
+    if image is None or isinstance(image, Frame):
+        return image
+    return Frame(image, timestamp)
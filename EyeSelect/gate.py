@@ -0,0 +1,77 @@
+"""Module providing a cheap gate skipping face inference on idle frames."""
+
+import cv2
+import numpy as np
+
+from EyeSelect.frame import as_frame
+
+
+class MotionGate:
+    """Decides from a tiny grayscale copy of a frame whether to run inference
+
+    While a face is visible every frame passes, eye movement is too small to
+    be seen at gate resolution. Without a face a frame passes when it
+    differs from the frame of the last inference by more than `threshold`
+    (mean absolute difference of 0-255 gray levels), so motion is caught at
+    once. After `idle_after` consecutive frames without a face the gate is
+    idle, then a still frame passes only every `idle_interval` frames.
+    """
+
+    def __init__(self, size=(64, 48), threshold=3.0, idle_after=30, idle_interval=15):
+        self.size = size
+        self.threshold = threshold
+        self.idle_after = idle_after
+        self.idle_interval = idle_interval
+
+        self.reference = None
+        self.small = None
+        self.motion = 0.0
+        self.face = False
+        self.no_face = 0
+        self.since_run = 0
+
+        self.frames = 0
+        self.passed = 0
+        self.skipped = 0
+
+    def idle(self):
+        return not self.face and self.no_face >= self.idle_after
+
+    def check(self, image):
+        """True when inference should run on image, a BGR array or a
+        frame.Frame sharing the gray thumbnail with other stages"""
+
+        self.frames += 1
+        self.since_run += 1
+        small = as_frame(image).getThumbnail(self.size)
+
+        if self.reference is None:
+            run = True
+            self.motion = 0.0
+        else:
+            self.motion = float(np.mean(cv2.absdiff(small, self.reference)))
+            run = (self.face or self.motion > self.threshold or
+                   not self.idle() or self.since_run >= self.idle_interval)
+
+        if run:
+            self.passed += 1
+            self.since_run = 0
+            self.reference = small
+        else:
+            self.skipped += 1
+        return run
+
+    def update(self, face):
+        """result of the inference on the last passed frame"""
+
+        self.face = face
+        self.no_face = 0 if face else self.no_face + 1
+
+    def getState(self):
+        return {
+            "frames": self.frames,
+            "passed": self.passed,
+            "skipped": self.skipped,
+            "idle": self.idle(),
+            "motion": self.motion,
+        }
@@ -0,0 +1,101 @@
+"""Module providing recording and model free replay of face landmarks."""
+
+import os
+import json
+import time
+
+import numpy as np
+
+LANDMARK_COUNT = 478
+
+
+def record_dtype(landmark_count=LANDMARK_COUNT):
+    """layout of a single frame of a landmark recording"""
+
+    return np.dtype([
+        ("timestamp", "<f8"),
+        ("width", "<u4"),
+        ("height", "<u4"),
+        ("face", "?"),
+        ("landmarks", "<f4", (landmark_count, 2)),
+    ])
+
+
+class LandmarkRecorder:
+    """Appends per frame face landmarks to a binary file
+
+    <path>       fixed size records with record_dtype() layout
+    <path>.json  number of landmarks per record
+
+    Pass it to EyeSelect(recorder=...) to record a live session.
+    """
+
+    def __init__(self, path, landmark_count=LANDMARK_COUNT):
+        self.path = path
+        self.count = 0
+        self.__record = np.zeros((), dtype=record_dtype(landmark_count))
+        self.__file = open(path, "wb")
+
+        with open(path + ".json", "w") as file:
+            json.dump({"landmarks": landmark_count}, file)
+
+    def write(self, landmarks, shape, timestamp=None):
+        """landmarks in pixel coordinates or None when there was no face"""
+
+        record = self.__record
+        record["timestamp"] = time.time() if timestamp is None else timestamp
+        record["height"] = shape[0]
+        record["width"] = shape[1]
+        record["face"] = landmarks is not None
+        if landmarks is not None:
+            record["landmarks"] = landmarks
+
+        self.__file.write(record.tobytes())
+        self.count += 1
+
+    def close(self):
+        self.__file.close()
+
+
+class LandmarkRecording:
+    """Memory mapped landmark recording written by LandmarkRecorder"""
+
+    def __init__(self, path):
+        with open(path + ".json", "r") as file:
+            header = json.load(file)
+
+        dtype = record_dtype(header["landmarks"])
+        count = os.path.getsize(path) // dtype.itemsize
+        if count:
+            self.records = np.memmap(path, dtype=dtype, mode="r", shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=dtype)
+
+    def __len__(self):
+        return len(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+
+def replay(path, eyeselect, **thresholds):
+    """Feeds a landmark recording into EyeSelect without images or the face
+    model, callbacks fire as in the recorded session.
+
+    eyeselect can be created with finder=False so the model isn't even
+    loaded. Returns relaxation tracker of every frame, NaN without a face.
+    """
+
+    recording = LandmarkRecording(path)
+    records = recording.records
+    relaxation = np.full(len(records), np.nan)
+
+    for index in range(len(records)):
+        record = records[index]
+        if not record["face"]:
+            continue
+
+        relaxation[index] = eyeselect.process_landmarks(
+            record["landmarks"], timestamp=float(record["timestamp"]), **thresholds)
+
+    return relaxation
@@ -0,0 +1,152 @@
+"""Module providing gesture detection for several faces in one camera."""
+
+import itertools
+
+from EyeSelect.face import FaceFinder, landmark_box
+from EyeSelect.frame import Frame
+from EyeSelect.eyeselect import EyeSelect
+
+
+def iou(a, b):
+    """intersection over union of two (x, y, width, height) boxes"""
+
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    w = min(ax + aw, bx + bw) - max(ax, bx)
+    h = min(ay + ah, by + bh) - max(ay, by)
+    if w <= 0 or h <= 0:
+        return 0.0
+    intersection = w * h
+    return intersection / float(aw * ah + bw * bh - intersection)
+
+
+class FaceTrack:
+    """gesture state of a single face"""
+
+    def __init__(self, face_id, box, eyeselect):
+        self.face_id = face_id
+        self.box = box
+        self.eyeselect = eyeselect
+        self.missing = 0
+
+
+class MultiFaceEyeSelect:
+    """Detects gestures of up to max_faces people with one face model
+
+    Every frame runs a single FaceFinder inference returning all faces. Faces
+    are matched to tracks of the previous frame by bounding box overlap, each
+    track owns an EyeSelect (buffers, baseline and latch state) that gets
+    only that face's landmarks. Callbacks are called with the face id, e.g.
+    left_cb(face_id). A track is forgotten after max_missing frames without
+    its face, a face appearing again afterwards gets a new id.
+    """
+
+    def __init__(self,
+                 left_cb=None,
+                 right_cb=None,
+                 blink_cb=None,
+                 up_cb=None,
+                 max_faces=2,
+                 finder=None,
+                 iou_threshold=0.3,
+                 max_missing=15,
+                 **eyeselect_kwargs):
+        if finder is None:
+            finder = FaceFinder(static_image_mode=False, max_num_faces=max_faces)
+        self.finder = finder
+
+        self.left_cb = left_cb
+        self.right_cb = right_cb
+        self.blink_cb = blink_cb
+        self.up_cb = up_cb
+        self.iou_threshold = iou_threshold
+        self.max_missing = max_missing
+        self.eyeselect_kwargs = eyeselect_kwargs
+
+        self.tracks = {}
+        self.__ids = itertools.count()
+
+    def _bind(self, callback, face_id):
+        if callback is None:
+            return None
+        return lambda: callback(face_id)
+
+    def _new_track(self, box):
+        face_id = next(self.__ids)
+        eyeselect = EyeSelect(
+            left_cb=self._bind(self.left_cb, face_id),
+            right_cb=self._bind(self.right_cb, face_id),
+            blink_cb=self._bind(self.blink_cb, face_id),
+            up_cb=self._bind(self.up_cb, face_id),
+            finder=False,
+            **self.eyeselect_kwargs)
+        track = FaceTrack(face_id, box, eyeselect)
+        self.tracks[face_id] = track
+        return track
+
+    def _associate(self, boxes):
+        """greedy matching of boxes to tracks by overlap, returns track of
+        every box"""
+
+        pairs = sorted(
+            ((iou(track.box, box), face_id, index)
+             for face_id, track in self.tracks.items()
+             for index, box in enumerate(boxes)),
+            reverse=True)
+
+        matched = [None] * len(boxes)
+        used = set()
+        for overlap, face_id, index in pairs:
+            if overlap < self.iou_threshold:
+                break
+            if face_id in used or matched[index] is not None:
+                continue
+            matched[index] = self.tracks[face_id]
+            used.add(face_id)
+
+        for face_id in list(self.tracks):
+            if face_id not in used:
+                track = self.tracks[face_id]
+                track.missing += 1
+                if track.missing > self.max_missing:
+                    del self.tracks[face_id]
+
+        for index, box in enumerate(boxes):
+            if matched[index] is None:
+                matched[index] = self._new_track(box)
+            matched[index].box = box
+            matched[index].missing = 0
+        return matched
+
+    def process(self, image, left_th=-100, right_th=100, up_th=1.5, blink_th=100, timestamp=None):
+        """returns {face_id: relaxation tracker} of faces in this frame"""
+
+        # conversions are shared by the finder and every face
+        frame = Frame(image, timestamp)
+        face_mesh = self.finder.find(frame)
+        faces = face_mesh.multi_face_landmarks if face_mesh else []
+
+        h, w = frame.height, frame.width
+        roi = self.finder.roi
+        boxes = [landmark_box(face_mesh, index, w, h, roi) for index in range(len(faces))]
+        tracks = self._associate(boxes)
+
+        if boxes:
+            # crop region of the finder has to cover every face
+            min_x = min(box[0] for box in boxes)
+            min_y = min(box[1] for box in boxes)
+            max_x = max(box[0] + box[2] for box in boxes)
+            max_y = max(box[1] + box[3] for box in boxes)
+            self.finder.update((min_x, min_y, max_x - min_x, max_y - min_y))
+
+        result = {}
+        for index, track in enumerate(tracks):
+            result[track.face_id] = track.eyeselect.process_face(
+                frame, face_mesh, roi, left_th, right_th, up_th, blink_th,
+                timestamp, index)
+        return result
+
+    def getFaces(self):
+        """face id -> bounding box of the faces currently tracked"""
+
+        return {face_id: track.box for face_id, track in self.tracks.items()}
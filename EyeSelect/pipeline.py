@@ -0,0 +1,169 @@
+"""Module providing pipelined capture, detection and gesture analysis."""
+
+import time
+import threading
+
+import numpy as np
+
+from EyeSelect.face import landmark_box
+from EyeSelect.frame import Frame
+from EyeSelect.utils import VideoCapture, DropQueue, RingBuffer
+
+
+class EyeSelectPipeline:
+    """Runs EyeSelect stages on separate threads connected by bounded queues
+
+    capture  -> reads frames from utils.VideoCapture and timestamps them
+    detect   -> FaceFinder.find
+    analyse  -> Face.process, features and EventSelector.select
+
+    Feature computation and event selection share a thread because detected
+    events reset the feature buffers. With drop=True every queue drops its
+    oldest frame when a later stage is slower, so latency never accumulates,
+    throughput is bounded by the slowest stage instead of the sum of all of
+    them. With drop=False stages wait for each other and every frame is
+    analysed. drop=None drops frames of cameras only, paths (video files and
+    recordings) and capture objects passed as source are analysed in full.
+
+    The face box steering FaceFinder is computed on the detect thread, so
+    the finder is only ever touched by that thread.
+
+    Frames carry the capture timestamp of the source (cap.timestamp, wall
+    clock when it has none), gesture relaxation and time windows use it.
+    Latency is counted from capture for sources that drop frames (cameras)
+    and from read() otherwise, recorded timestamps lie in the past.
+    """
+
+    def __init__(self, eyeselect, source=0, queue_size=1, drop=None, **thresholds):
+        self.eyeselect = eyeselect
+        self.source = source
+        self.thresholds = thresholds
+
+        if drop is None:
+            drop = isinstance(source, int)
+        self.drop = drop
+        self.detect_queue = DropQueue(queue_size, drop)
+        self.analyse_queue = DropQueue(queue_size, drop)
+
+        self.cap = None
+        self.run = False
+        self.threads = []
+
+        self.frames = 0
+        self.faces = 0
+        self.relaxation_tracker = None
+        self.latency = RingBuffer(256, width=1)
+        self.__lock = threading.Lock()
+
+    def start(self):
+        if isinstance(self.source, (int, str)):
+            self.cap = VideoCapture(self.source, bufforless=self.drop)
+        else:
+            self.cap = self.source
+
+        self.run = True
+        self.threads = [
+            threading.Thread(target=self.__capture, daemon=True),
+            threading.Thread(target=self.__detect, daemon=True),
+            threading.Thread(target=self.__analyse, daemon=True),
+        ]
+        for thread in self.threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self.run = False
+        self.detect_queue.close()
+        self.analyse_queue.close()
+
+        if self.cap is not None and self.cap is not self.source:
+            self.cap.close()
+
+        for thread in self.threads:
+            if thread is not threading.current_thread():
+                thread.join(timeout=1.0)
+
+    def join(self):
+        """waits until the source runs out of frames"""
+
+        for thread in self.threads:
+            thread.join()
+
+    def __capture(self):
+        index = 0
+        while self.run:
+            ret, frame = self.cap.read()
+            now = time.time()
+            if frame is None:
+                break
+
+            timestamp = getattr(self.cap, "timestamp", None)
+            if timestamp is None:
+                timestamp = now
+            stamp = timestamp if self.drop else now
+            # detection and analysis share conversions of the frame
+            self.detect_queue.put((index, stamp, Frame(frame, timestamp)))
+            index += 1
+            if not ret:
+                break
+
+        self.detect_queue.close()
+
+    def __detect(self):
+        finder = self.eyeselect.finder
+        while True:
+            item = self.detect_queue.get()
+            if item is None:
+                break
+
+            index, stamp, frame = item
+            face_mesh = finder.find(frame)
+            roi = finder.roi
+            if face_mesh:
+                # box for the region of the next frame, taken from the
+                # landmarks here instead of waiting for the analyse thread
+                finder.update(landmark_box(face_mesh, 0, frame.width, frame.height, roi))
+            self.analyse_queue.put((index, stamp, frame, face_mesh, roi))
+
+        self.analyse_queue.close()
+
+    def __analyse(self):
+        while True:
+            item = self.analyse_queue.get()
+            if item is None:
+                break
+
+            index, stamp, frame, face_mesh, roi = item
+            relaxation_tracker = None
+            self.eyeselect.metrics.count("frames")
+            if not face_mesh:
+                self.eyeselect.metrics.count("no_face")
+            else:
+                relaxation_tracker = self.eyeselect.process_face(
+                    frame, face_mesh, roi, timestamp=frame.timestamp, **self.thresholds)
+
+            with self.__lock:
+                self.frames += 1
+                if face_mesh:
+                    self.faces += 1
+                    self.relaxation_tracker = relaxation_tracker
+                self.latency.add((time.time() - stamp,))
+
+    def getStats(self):
+        """end to end (capture to decision) latency in seconds and counters"""
+
+        with self.__lock:
+            latencies = self.latency.values()[:, 0].copy()
+            stats = {
+                "frames": self.frames,
+                "faces": self.faces,
+                "dropped_detect": self.detect_queue.dropped,
+                "dropped_analyse": self.analyse_queue.dropped,
+                "relaxation_tracker": self.relaxation_tracker,
+            }
+
+        if len(latencies):
+            stats["latency_mean"] = float(np.mean(latencies))
+            stats["latency_p95"] = float(np.percentile(latencies, 95))
+            stats["latency_max"] = float(np.max(latencies))
+        return stats
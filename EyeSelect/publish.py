@@ -0,0 +1,202 @@
+"""Module providing shared memory and socket publishing of features and events."""
+
+import os
+import socket
+import struct
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from EyeSelect.eyeselect import EVENTS, EyeIntermediateObject
+
+# event field of a record, 0 when nothing was detected
+EVENT_CODES = {event: code for code, event in enumerate(EVENTS, 1)}
+
+# one record per processed frame, features are NaN without a face
+RECORD_DTYPE = np.dtype([
+    ("seq", "<u8"),
+    ("frame", "<u8"),
+    ("timestamp", "<f8"),
+    ("face", "?"),
+    ("event", "u1"),
+] + EyeIntermediateObject.DTYPE.descr)
+
+# records written so far, capacity
+_HEADER = struct.Struct("<QQ")
+
+
+def _attach(name):
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        # before python 3.13 attaching registers the block with the resource
+        # tracker, which would unlink it when this process exits
+        from multiprocessing import resource_tracker
+        memory = shared_memory.SharedMemory(name)
+        resource_tracker.unregister(memory._name, "shared_memory")
+        return memory
+
+
+class Publisher:
+    """Publishes per frame features and events of EyeSelect
+
+    Records go to a ring of `capacity` slots in shared memory named `name`.
+    Every slot is guarded by a sequence number (seqlock): it is odd while
+    the slot is written and even afterwards, readers copy a slot and accept
+    it when the number didn't change, so the writer never waits for readers.
+    With socket_path records are also sent to every client of a Unix
+    SOCK_SEQPACKET socket, a client that isn't keeping up loses records.
+
+    Pass it to EyeSelect(publisher=...), read with Subscriber or
+    SocketSubscriber.
+    """
+
+    def __init__(self, name, capacity=1024, socket_path=None):
+        self.capacity = capacity
+        self.frame = 0
+        self.dropped = 0
+
+        size = _HEADER.size + capacity * RECORD_DTYPE.itemsize
+        self.memory = shared_memory.SharedMemory(name, create=True, size=size)
+        _HEADER.pack_into(self.memory.buf, 0, 0, capacity)
+        self.records = np.ndarray((capacity,), dtype=RECORD_DTYPE,
+                                  buffer=self.memory.buf, offset=_HEADER.size)
+        self.records["seq"] = 0
+
+        self.socket_path = socket_path
+        self.server = None
+        self.clients = []
+        self.__lock = threading.Lock()
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.server = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+            self.server.bind(socket_path)
+            self.server.listen()
+            self.thread = threading.Thread(target=self.__accept, daemon=True)
+            self.thread.start()
+
+    def __accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                break
+            client.setblocking(False)
+            with self.__lock:
+                self.clients.append(client)
+
+    def write(self, eio, timestamp, gesture=None):
+        """eio None for a frame without a face, gesture detected in it"""
+
+        count = self.frame
+        record = self.records[count % self.capacity]
+
+        record["seq"] = 2 * count + 1
+        record["frame"] = count
+        record["timestamp"] = timestamp
+        record["face"] = eio is not None
+        record["event"] = EVENT_CODES.get(gesture, 0)
+        if eio is None:
+            for name in EyeIntermediateObject.DTYPE.names:
+                record[name] = np.nan
+        else:
+            eio.toRecord(record)
+        record["seq"] = 2 * count + 2
+
+        self.frame = count + 1
+        _HEADER.pack_into(self.memory.buf, 0, self.frame, self.capacity)
+
+        if self.clients:
+            self.__send(record.tobytes())
+
+    def __send(self, data):
+        with self.__lock:
+            clients = list(self.clients)
+
+        for client in clients:
+            try:
+                client.send(data)
+            except BlockingIOError:
+                self.dropped += 1
+            except OSError:
+                with self.__lock:
+                    self.clients.remove(client)
+                client.close()
+
+    def close(self):
+        if self.server is not None:
+            self.server.close()
+            with self.__lock:
+                for client in self.clients:
+                    client.close()
+                self.clients = []
+            os.unlink(self.socket_path)
+
+        del self.records
+        self.memory.close()
+        self.memory.unlink()
+
+
+class Subscriber:
+    """Reads records published to shared memory `name` from another process"""
+
+    def __init__(self, name, start_latest=True):
+        self.memory = _attach(name)
+        written, self.capacity = _HEADER.unpack_from(self.memory.buf, 0)
+        self.records = np.ndarray((self.capacity,), dtype=RECORD_DTYPE,
+                                  buffer=self.memory.buf, offset=_HEADER.size)
+        self.next = written if start_latest else max(written - self.capacity, 0)
+        self.lost = 0
+
+    def read(self):
+        """records written since the last call (RECORD_DTYPE array), records
+        overwritten before they could be read are counted in `lost`"""
+
+        written = _HEADER.unpack_from(self.memory.buf, 0)[0]
+        if written - self.next > self.capacity:
+            self.lost += written - self.next - self.capacity
+            self.next = written - self.capacity
+
+        result = np.zeros(written - self.next, dtype=RECORD_DTYPE)
+        count = 0
+        for frame in range(self.next, written):
+            slot = self.records[frame % self.capacity]
+            expected = 2 * frame + 2
+            if slot["seq"] != expected:
+                # already overwritten by a newer frame
+                self.lost += 1
+                continue
+            record = slot.copy()
+            if slot["seq"] != expected:
+                self.lost += 1
+                continue
+            result[count] = record
+            count += 1
+
+        self.next = written
+        return result[:count]
+
+    def close(self):
+        del self.records
+        self.memory.close()
+
+
+class SocketSubscriber:
+    """Receives records from the socket of a Publisher"""
+
+    def __init__(self, socket_path):
+        self.socket = socket.socket(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self.socket.connect(socket_path)
+
+    def read(self):
+        """next record, blocks until one arrives, None when publisher closed"""
+
+        data = self.socket.recv(RECORD_DTYPE.itemsize)
+        if not data:
+            return None
+        return np.frombuffer(data, dtype=RECORD_DTYPE)[0]
+
+    def close(self):
+        self.socket.close()
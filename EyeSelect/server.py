@@ -0,0 +1,195 @@
+"""Module providing gesture detection for many cameras in one process."""
+
+import os
+import time
+import queue
+import threading
+import collections
+
+import numpy as np
+import mediapipe as mp
+
+from EyeSelect.face import FaceFinder
+from EyeSelect.eyeselect import EyeSelect
+from EyeSelect.utils import VideoCapture, RingBuffer
+
+
+class InferencePool:
+    """Fixed number of static mode face mesh graphs shared by many streams
+
+    process() borrows a free graph and blocks while all of them are busy, so
+    at most `workers` inferences run at once however many streams there are.
+    Static mode keeps graphs stateless, any frame can go to any graph.
+    """
+
+    def __init__(self, workers=None, max_num_faces=1, min_detection_confidence=0.5):
+        # MediaPipe graphs are multithreaded themselves, one graph per two
+        # cores avoids oversubscribing the machine
+        self.workers = workers or max((os.cpu_count() or 2) // 2, 1)
+        self.max_num_faces = max_num_faces
+        self.__meshes = queue.Queue()
+        for _ in range(self.workers):
+            self.__meshes.put(mp.solutions.face_mesh.FaceMesh(
+                refine_landmarks=True,
+                max_num_faces=max_num_faces,
+                static_image_mode=True,
+                min_detection_confidence=min_detection_confidence
+            ))
+
+    def process(self, rgb):
+        mesh = self.__meshes.get()
+        try:
+            return mesh.process(rgb)
+        finally:
+            self.__meshes.put(mesh)
+
+
+class PooledFaceFinder(FaceFinder):
+    """FaceFinder running its inference on a shared InferencePool"""
+
+    def __init__(self, pool, **kwargs):
+        self.pool = pool
+        kwargs["static_image_mode"] = True
+        kwargs["max_num_faces"] = pool.max_num_faces
+        super().__init__(**kwargs)
+
+    def _create_mesh(self, min_detection_confidence, min_tracking_confidence):
+        return None
+
+    def _infer(self, rgb):
+        return self.pool.process(rgb)
+
+
+class Stream:
+    """state and statistics of a single source"""
+
+    def __init__(self, stream_id, source, eyeselect):
+        self.stream_id = stream_id
+        self.source = source
+        self.eyeselect = eyeselect
+        self.cap = None
+        self.thread = None
+
+        self.frames = 0
+        self.faces = 0
+        self.relaxation_tracker = None
+        self.latency = RingBuffer(256, width=1)
+        self.done = collections.deque(maxlen=64)
+        self.lock = threading.Lock()
+
+    def getStats(self):
+        with self.lock:
+            latencies = self.latency.values()[:, 0].copy()
+            done = list(self.done)
+            stats = {
+                "frames": self.frames,
+                "faces": self.faces,
+                "relaxation_tracker": self.relaxation_tracker,
+            }
+
+        # over the last frames, so it follows changes of load
+        stats["fps"] = 0.0
+        if len(done) > 1 and done[-1] > done[0]:
+            stats["fps"] = (len(done) - 1) / (done[-1] - done[0])
+        if len(latencies):
+            stats["latency_mean"] = float(np.mean(latencies))
+            stats["latency_p95"] = float(np.percentile(latencies, 95))
+            stats["latency_max"] = float(np.max(latencies))
+        return stats
+
+
+class GestureServer:
+    """Runs EyeSelect on many sources with one shared inference pool
+
+    Every source (camera index, video file or recording, see
+    utils.VideoCapture) gets its own thread and EyeSelect state, face mesh
+    inference of all of them is scheduled over InferencePool(workers).
+    Callbacks are called with the stream id, the index of the source, e.g.
+    left_cb(stream_id). Cameras keep only their latest frame, every frame of
+    video files and recordings is processed.
+    """
+
+    def __init__(self,
+                 sources,
+                 left_cb=None,
+                 right_cb=None,
+                 blink_cb=None,
+                 up_cb=None,
+                 workers=None,
+                 finder_kwargs=None,
+                 eyeselect_kwargs=None,
+                 **thresholds):
+        self.pool = InferencePool(workers)
+        self.thresholds = thresholds
+        self.run = False
+
+        finder_kwargs = {} if finder_kwargs is None else finder_kwargs
+        eyeselect_kwargs = {} if eyeselect_kwargs is None else eyeselect_kwargs
+        bind = lambda callback, stream_id: None if callback is None else (lambda: callback(stream_id))
+
+        self.streams = []
+        for stream_id, source in enumerate(sources):
+            eyeselect = EyeSelect(
+                left_cb=bind(left_cb, stream_id),
+                right_cb=bind(right_cb, stream_id),
+                blink_cb=bind(blink_cb, stream_id),
+                up_cb=bind(up_cb, stream_id),
+                finder=PooledFaceFinder(self.pool, **finder_kwargs),
+                **eyeselect_kwargs)
+            self.streams.append(Stream(stream_id, source, eyeselect))
+
+    def start(self):
+        self.run = True
+        for stream in self.streams:
+            if isinstance(stream.source, (int, str)):
+                # only cameras may drop frames a slow stream couldn't take
+                stream.cap = VideoCapture(stream.source,
+                                          bufforless=isinstance(stream.source, int))
+            else:
+                stream.cap = stream.source
+            stream.thread = threading.Thread(target=self.__serve, args=(stream,), daemon=True)
+            stream.thread.start()
+        return self
+
+    def stop(self):
+        self.run = False
+        for stream in self.streams:
+            if stream.cap is not None and stream.cap is not stream.source:
+                stream.cap.close()
+        for stream in self.streams:
+            if stream.thread is not None:
+                stream.thread.join(timeout=1.0)
+
+    def join(self):
+        """waits until every source runs out of frames"""
+
+        for stream in self.streams:
+            stream.thread.join()
+
+    def __serve(self, stream):
+        eyeselect = stream.eyeselect
+        while self.run:
+            ret, frame = stream.cap.read()
+            if frame is None:
+                break
+
+            start = time.monotonic()
+            relaxation_tracker = eyeselect.process(frame, **self.thresholds)
+            end = time.monotonic()
+
+            with stream.lock:
+                stream.frames += 1
+                if relaxation_tracker is not None:
+                    stream.faces += 1
+                    stream.relaxation_tracker = relaxation_tracker
+                stream.latency.add((end - start,))
+                stream.done.append(end)
+
+            if not ret:
+                break
+
+    def getStats(self):
+        """per stream fps, frames, faces and read to decision latency in
+        seconds"""
+
+        return {stream.stream_id: stream.getStats() for stream in self.streams}
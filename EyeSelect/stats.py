@@ -0,0 +1,119 @@
+"""Module providing low overhead counters and latency histograms."""
+
+import time
+import threading
+
+
+class Histogram:
+    """Latency histogram with power of two buckets in microseconds
+
+    Bucket i holds samples below 2**i us, so adding a sample is a few integer
+    operations and memory does not grow with the number of samples.
+    Percentiles are reported as the upper bound of their bucket.
+    """
+
+    BUCKETS = 32
+
+    def __init__(self):
+        self.clear()
+
+    def add(self, seconds):
+        index = int(seconds * 1e6).bit_length()
+        self.buckets[index if index < self.BUCKETS else self.BUCKETS - 1] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+
+        rank = q / 100 * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << index) * 1e-6, self.max)
+        return self.max
+
+    def clear(self):
+        self.buckets = [0] * self.BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def summary(self):
+        """count and latencies in seconds"""
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else None,
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max if self.count else None,
+        }
+
+
+class Stats:
+    """Per stage latency histograms and named counters
+
+    Stages are timed with monotonic perf_counter:
+
+        start = stats.start()
+        ...
+        stats.stop("stage", start)
+
+    A disabled instance ignores every call, so instrumented code only pays an
+    attribute lookup and a branch.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.counters = {}
+        self.histograms = {}
+        self.__lock = threading.Lock()
+
+    def start(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def stop(self, stage, start):
+        if self.enabled:
+            self.observe(stage, time.perf_counter() - start)
+
+    def observe(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.__lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.add(seconds)
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def reset(self):
+        with self.__lock:
+            self.counters = {}
+            self.histograms = {}
+
+    def snapshot(self):
+        with self.__lock:
+            return {
+                "enabled": self.enabled,
+                "counters": dict(self.counters),
+                "latency": {stage: histogram.summary()
+                            for stage, histogram in self.histograms.items()},
+            }
+
+
+# shared by objects created without their own Stats, never records anything
+DISABLED = Stats(enabled=False)
+
+# used by utils.timeit
+DEFAULT = Stats()
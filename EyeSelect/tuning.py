@@ -0,0 +1,262 @@
+"""Module providing threshold sweeps of the gesture rules on recorded features."""
+
+import os
+import sys
+import itertools
+import concurrent.futures
+
+import numpy as np
+
+from EyeSelect.eyeselect import EyeSelect, EyeBaselineTracker
+
+# detectors in the order EyeSelect registers them in its EventSelector
+GESTURES = ("right", "left", "up", "blink")
+
+DEFAULTS = {
+    "left_th": -100.0,
+    "right_th": 100.0,
+    "blink_th": 100.0,
+    "relaxation": 0.5,
+    "unlatch_margin": EyeSelect.UNLATCH_MARGIN,
+    "up_x_factor": EyeSelect.UP_X_FACTOR,
+    "up_y_factor": EyeSelect.UP_Y_FACTOR,
+    "up_std_factor": EyeSelect.UP_STD_FACTOR,
+    "blink_std_factor": EyeSelect.BLINK_STD_FACTOR,
+    "unlatch_std_factor": EyeSelect.UNLATCH_STD_FACTOR,
+}
+
+
+def baselines(features, window=None, decay=None):
+    """baseline medians seen by every frame, computed before the frame itself
+    is added as EyeSelect does, rows without a face repeat previous values"""
+
+    tracker = EyeBaselineTracker(window, decay)
+    names = EyeBaselineTracker.FIELDS
+    table = np.zeros(len(features), dtype=[(name, "f8") for name in names])
+
+    for index in range(len(features)):
+        row = table[index]
+        for name in names:
+            row[name] = getattr(tracker, name)
+        if features["face"][index]:
+            tracker.add_obj(_Row(features[index]))
+
+    return table
+
+
+class _Row:
+    """attribute access to a feature table row for EyeBaselineTracker"""
+
+    def __init__(self, row):
+        self.__row = row
+
+    def __getattr__(self, name):
+        return self.__row[name]
+
+
+def make_grid(**values):
+    """every combination of given parameter values, others keep DEFAULTS"""
+
+    names = list(DEFAULTS)
+    axes = [np.atleast_1d(np.asarray(values.get(name, DEFAULTS[name]), dtype=np.float64))
+            for name in names]
+    unknown = set(values) - set(names)
+    if unknown:
+        raise ValueError(f"unknown parameters: {', '.join(sorted(unknown))}")
+
+    grid = np.zeros(int(np.prod([len(axis) for axis in axes])),
+                    dtype=[(name, "f8") for name in names])
+    for name, column in zip(names, np.meshgrid(*axes, indexing="ij")):
+        grid[name] = column.ravel()
+    return grid
+
+
+def simulate(features, base, grid):
+    """Runs the EventSelector latch logic for every grid row at once
+
+    Loops over frames only, each step evaluates all settings with numpy.
+    Features are taken as recorded, the buffer reset that follows a real
+    detection is not replayed. Returns (setting, frame, gesture) arrays of
+    detected events.
+    """
+
+    g = lambda name: grid[name][None, :]
+    f = lambda name: features[name][:, None]
+    b = lambda name: base[name][:, None]
+
+    # frames x settings trigger and unlatch conditions, one pass per rule
+    trigger = np.stack((
+        (f("std_x") > b("std_x")) & (f("x") > g("right_th") + b("x")),
+        (f("std_x") > b("std_x")) & (f("x") < g("left_th") + b("x")),
+        (f("max_dist_x") < b("max_dist_x") * g("up_x_factor")) &
+        (f("max_dist_y") > b("max_dist_y") * g("up_y_factor")) &
+        (f("std_y") > b("std_y") * g("up_std_factor")),
+        (f("max_radius") > g("blink_th")) &
+        (f("std_x") > b("std_x") * g("blink_std_factor")) &
+        (f("std_y") > b("std_y") * g("blink_std_factor")),
+    ), axis=2)
+
+    unlatch = np.stack((
+        (f("std_x") < b("std_x")) & (f("x") < g("right_th") + b("x") - g("unlatch_margin")),
+        (f("std_x") < b("std_x")) & (f("x") > g("left_th") + b("x") + g("unlatch_margin")),
+        f("std_y") < b("std_y") * g("unlatch_std_factor"),
+        f("std_y") < b("std_y") * g("unlatch_std_factor"),
+    ), axis=2)
+
+    settings = len(grid)
+    columns = np.arange(settings)
+    relaxation = grid["relaxation"]
+    latched = np.full(settings, -1)
+    start = None
+
+    events = ([], [], [])
+    for frame in range(len(features)):
+        if not features["face"][frame]:
+            continue
+
+        now = features["timestamp"][frame]
+        if start is None:
+            start = np.full(settings, now)
+
+        ready = (now - start) >= relaxation
+        was_latched = latched >= 0
+
+        released = ready & was_latched & unlatch[frame, columns, np.maximum(latched, 0)]
+        latched[released] = -1
+
+        fired = ready & ~was_latched & trigger[frame].any(axis=1)
+        if fired.any():
+            hit = np.nonzero(fired)[0]
+            gesture = np.argmax(trigger[frame, hit], axis=1)
+            latched[hit] = gesture
+            start[hit] = now
+
+            events[0].append(hit)
+            events[1].append(np.full(len(hit), frame))
+            events[2].append(gesture)
+
+    if not events[0]:
+        return tuple(np.zeros(0, dtype=np.int64) for _ in range(3))
+    return tuple(np.concatenate(column) for column in events)
+
+
+def score(features, events, labels, settings, tolerance=0.5):
+    """precision, recall and mean latency of detected events against labels
+
+    labels are (timestamp, gesture) pairs, a detection of the same gesture up
+    to tolerance seconds after the label counts as true positive.
+    """
+
+    label_times = np.array([label[0] for label in labels], dtype=np.float64)
+    label_gestures = np.array([GESTURES.index(label[1]) for label in labels])
+
+    result = np.zeros(settings, dtype=[
+        ("true_positives", "i8"),
+        ("false_positives", "i8"),
+        ("false_negatives", "i8"),
+        ("precision", "f8"),
+        ("recall", "f8"),
+        ("f1", "f8"),
+        ("latency", "f8"),
+    ])
+
+    setting, frame, gesture = events
+    times = features["timestamp"][frame]
+    order = np.argsort(setting, kind="stable")
+    bounds = np.searchsorted(setting[order], np.arange(settings + 1))
+
+    for index in range(settings):
+        chosen = order[bounds[index]:bounds[index + 1]]
+        event_times = times[chosen]
+        event_gestures = gesture[chosen]
+
+        # label x event matrix of admissible matches
+        delay = event_times[None, :] - label_times[:, None]
+        match = (delay >= 0) & (delay <= tolerance) & \
+            (event_gestures[None, :] == label_gestures[:, None])
+
+        found = match.any(axis=1)
+        first = np.argmax(match, axis=1) if len(chosen) else np.zeros(len(labels), dtype=np.int64)
+        used = np.zeros(len(chosen), dtype=bool)
+        used[first[found]] = True
+
+        true_positives = int(found.sum())
+        false_positives = int(len(chosen) - used.sum())
+        false_negatives = len(labels) - true_positives
+
+        row = result[index]
+        row["true_positives"] = true_positives
+        row["false_positives"] = false_positives
+        row["false_negatives"] = false_negatives
+        row["precision"] = true_positives / max(true_positives + false_positives, 1)
+        row["recall"] = true_positives / max(len(labels), 1)
+        row["f1"] = 2 * row["precision"] * row["recall"] / max(row["precision"] + row["recall"], 1e-12)
+        row["latency"] = np.mean(delay[found, first[found]]) if true_positives else np.nan
+
+    return result
+
+
+def _evaluate(features, base, grid, labels, tolerance):
+    events = simulate(features, base, grid)
+    return score(features, events, labels, len(grid), tolerance)
+
+
+def sweep(features, labels, grid, workers=None, chunk_size=64, tolerance=0.5,
+          baseline_window=None, baseline_decay=None):
+    """Evaluates every row of grid (see make_grid) on a feature table
+    (batch.TABLE_DTYPE) and labeled (timestamp, gesture) pairs
+
+    The grid is split into chunks evaluated in parallel, returns one row per
+    setting holding its parameters and scores, best f1 first.
+    """
+
+    base = baselines(features, baseline_window, baseline_decay)
+    chunks = [grid[start:start + chunk_size] for start in range(0, len(grid), chunk_size)]
+
+    if workers == 1 or len(chunks) == 1:
+        scores = [_evaluate(features, base, chunk, labels, tolerance) for chunk in chunks]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            scores = list(pool.map(_evaluate, itertools.repeat(features),
+                                   itertools.repeat(base), chunks,
+                                   itertools.repeat(labels), itertools.repeat(tolerance)))
+
+    scores = np.concatenate(scores)
+    result = np.zeros(len(grid), dtype=grid.dtype.descr + scores.dtype.descr)
+    for name in grid.dtype.names:
+        result[name] = grid[name]
+    for name in scores.dtype.names:
+        result[name] = scores[name]
+
+    return result[np.argsort(-result["f1"], kind="stable")]
+
+
+def load_labels(path):
+    """reads `timestamp,gesture` lines"""
+
+    labels = []
+    with open(path, "r") as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            timestamp, gesture = line.split(",")
+            labels.append((float(timestamp), gesture.strip()))
+    return labels
+
+
+if __name__ == "__main__":
+    # python -m EyeSelect.tuning features.npy labels.csv
+    features = np.load(sys.argv[1])
+    labels = load_labels(sys.argv[2])
+
+    grid = make_grid(
+        left_th=np.arange(-150, -20, 10),
+        right_th=np.arange(20, 150, 10),
+        blink_th=np.arange(20, 160, 20),
+        up_y_factor=(1.25, 1.5, 1.75, 2.0),
+    )
+    result = sweep(features, labels, grid, workers=os.cpu_count())
+
+    for row in result[:10]:
+        print(", ".join(f"{name}={row[name]:.3g}" for name in result.dtype.names))
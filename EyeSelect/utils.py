@@ -1,25 +1,35 @@
+import os
+import json
 import time
+import heapq
 import queue
 import pickle
+import struct
 import platform
 import threading
+import collections
 
 import cv2
 import numpy as np
 
+from EyeSelect import stats
+
 # Make predictions for new data points
 
 def timeit(func):
     """
-    timeit
+    timeit, records latency of every call in stats.DEFAULT under the
+    function name, read it with stats.DEFAULT.snapshot()
     """
+    name = func.__qualname__
+
     def inner(*args, **kwargs):
         """
         inner
         """
-        start = time.time()
+        start = stats.DEFAULT.start()
         ret = func(*args, **kwargs)
-        print(f"Elapsed time: {time.time() - start}")
+        stats.DEFAULT.stop(name, start)
         return ret
     return inner
 
@@ -135,18 +145,576 @@ class Buffor:
     def clear(self):
         self.__buffor = []
 
+
+class RingBuffer:
+    """Fixed capacity buffer of vectors keeping running sums for O(1) mean/std
+
+    Values added with a timestamp can be expired by age, so the buffer holds
+    a time window instead of a number of values.
+    """
+
+    def __init__(self, capacity, width=2, dtype=np.float64):
+        self.capacity = capacity
+        self.width = width
+        self.__data = np.zeros((capacity, width), dtype=dtype)
+        self.__times = None
+        self.__head = 0
+        self.__count = 0
+        self.__sum = [0.0] * width
+        self.__sum_sq = [0.0] * width
+
+    def add(self, values, timestamp=None):
+        if timestamp is not None:
+            if self.__times is None:
+                self.__times = np.zeros(self.capacity)
+            self.__times[self.__head] = timestamp
+
+        data = self.__data
+        head = self.__head
+        sums = self.__sum
+        sums_sq = self.__sum_sq
+
+        if self.__count == self.capacity:
+            for i in range(self.width):
+                old = float(data[head, i])
+                sums[i] -= old
+                sums_sq[i] -= old * old
+        else:
+            self.__count += 1
+
+        for i in range(self.width):
+            value = float(values[i])
+            data[head, i] = value
+            sums[i] += value
+            sums_sq[i] += value * value
+
+        head += 1
+        if head == self.capacity:
+            head = 0
+        self.__head = head
+        if head == 0:
+            # resynchronise running sums once per lap so float error can't drift
+            self.__resync()
+
+    def expire(self, before):
+        """drops the oldest values with timestamp <= before"""
+
+        if self.__times is None:
+            return
+
+        data = self.__data
+        times = self.__times
+        sums = self.__sum
+        sums_sq = self.__sum_sq
+        while self.__count:
+            oldest = (self.__head - self.__count) % self.capacity
+            if times[oldest] > before:
+                break
+            for i in range(self.width):
+                old = float(data[oldest, i])
+                sums[i] -= old
+                sums_sq[i] -= old * old
+            self.__count -= 1
+
+        if not self.__count:
+            for i in range(self.width):
+                sums[i] = 0.0
+                sums_sq[i] = 0.0
+
+    def __resync(self):
+        valid = self.values()
+        for i in range(self.width):
+            column = valid[:, i]
+            self.__sum[i] = float(column.sum())
+            self.__sum_sq[i] = float(np.dot(column, column))
+
+    def mean(self):
+        if self.__count == 0:
+            return tuple(0.0 for _ in range(self.width))
+        return tuple(s / self.__count for s in self.__sum)
+
+    def std(self):
+        """population std of every column, (0.0, ...) with less than 2 values"""
+        count = self.__count
+        if count < 2:
+            return tuple(0.0 for _ in range(self.width))
+
+        stds = []
+        for s, sq in zip(self.__sum, self.__sum_sq):
+            mean = s / count
+            stds.append(max(sq / count - mean * mean, 0.0) ** 0.5)
+        return tuple(stds)
+
+    def values(self):
+        """stored values, a view unless expired values made them wrap
+        around, oldest first order is not guaranteed"""
+        start = self.__head - self.__count
+        if start >= 0:
+            return self.__data[start:self.__head]
+        if self.__count == self.capacity:
+            return self.__data
+        return np.concatenate((self.__data[start:], self.__data[:self.__head]))
+
+    def clear(self):
+        self.__head = 0
+        self.__count = 0
+        for i in range(self.width):
+            self.__sum[i] = 0.0
+            self.__sum_sq[i] = 0.0
+
+    def __len__(self):
+        return self.__count
+
+
+class SpreadTracker:
+    """Spread of 2d points added over the last `window` steps
+
+    Every step adds a fixed number of points. Windowed min/max of both axes
+    are kept in monotonic deques (amortized O(1) per step), the diameter is
+    the largest distance between convex hull vertices, so it grows with the
+    hull size rather than quadratically with the number of points. Steps
+    added with a timestamp can also be expired by age.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.__data = None
+        self.__times = np.zeros(window)
+        self.__step = 0
+        self.__oldest = 0
+        # (step, value) pairs, values monotonic from the front
+        self.__max_x = collections.deque()
+        self.__min_x = collections.deque()
+        self.__max_y = collections.deque()
+        self.__min_y = collections.deque()
+
+    def add(self, points, timestamp=None):
+        """points of a single step, sequence of (x, y)"""
+
+        if self.__data is None:
+            self.__data = np.zeros((self.window, len(points), 2))
+
+        step = self.__step
+        slot = step % self.window
+        row = self.__data[slot]
+        low_x = low_y = float("inf")
+        high_x = high_y = float("-inf")
+        for index, (x, y) in enumerate(points):
+            x = float(x)
+            y = float(y)
+            row[index, 0] = x
+            row[index, 1] = y
+            low_x = min(low_x, x)
+            high_x = max(high_x, x)
+            low_y = min(low_y, y)
+            high_y = max(high_y, y)
+        if timestamp is not None:
+            self.__times[slot] = timestamp
+
+        self.__step = step + 1
+        self.__oldest = max(self.__oldest, self.__step - self.window)
+        self.__push(self.__max_x, step, high_x, True)
+        self.__push(self.__min_x, step, low_x, False)
+        self.__push(self.__max_y, step, high_y, True)
+        self.__push(self.__min_y, step, low_y, False)
+        self.__evict()
+
+    @staticmethod
+    def __push(extremes, step, value, maximum):
+        if maximum:
+            while extremes and extremes[-1][1] <= value:
+                extremes.pop()
+        else:
+            while extremes and extremes[-1][1] >= value:
+                extremes.pop()
+        extremes.append((step, value))
+
+    def __evict(self):
+        oldest = self.__oldest
+        for extremes in (self.__max_x, self.__min_x, self.__max_y, self.__min_y):
+            while extremes and extremes[0][0] < oldest:
+                extremes.popleft()
+
+    def expire(self, before):
+        """drops the oldest steps with timestamp <= before"""
+
+        while self.__oldest < self.__step and \
+                self.__times[self.__oldest % self.window] <= before:
+            self.__oldest += 1
+        self.__evict()
+
+    def range(self):
+        """(max - min) of x and y, (0.0, 0.0) when empty"""
+
+        if self.__oldest == self.__step:
+            return 0.0, 0.0
+        return (self.__max_x[0][1] - self.__min_x[0][1],
+                self.__max_y[0][1] - self.__min_y[0][1])
+
+    def values(self):
+        """points in the window as (n, 2) array, order is not guaranteed"""
+
+        count = self.__step - self.__oldest
+        if not count:
+            return np.zeros((0, 2))
+        if count == self.window:
+            return self.__data.reshape(-1, 2)
+        start = self.__oldest % self.window
+        if start + count <= self.window:
+            return self.__data[start:start + count].reshape(-1, 2)
+        slots = np.arange(self.__oldest, self.__step) % self.window
+        return self.__data[slots].reshape(-1, 2)
+
+    def diameter(self):
+        """largest distance between two points in the window"""
+
+        points = self.values()
+        if len(points) < 2:
+            return 0.0
+
+        hull = points[cv2.convexHull(points.astype(np.float32), returnPoints=False)[:, 0]]
+        delta = hull[:, None, :] - hull[None, :, :]
+        return float(np.sqrt(np.max(np.einsum("ijk,ijk->ij", delta, delta))))
+
+    def clear(self):
+        self.__step = 0
+        self.__oldest = 0
+        self.__max_x.clear()
+        self.__min_x.clear()
+        self.__max_y.clear()
+        self.__min_y.clear()
+
+    def __len__(self):
+        return self.__step - self.__oldest
+
+
+class RunningMedian:
+    """Streaming median using two heaps, O(log n) per value
+
+    With window set only the last `window` values are taken into account and
+    memory stays bounded, otherwise the median of the whole stream is kept.
+    """
+
+    def __init__(self, window=None):
+        self.window = window
+        self.__low = []   # max heap stored as negated values
+        self.__high = []  # min heap
+        self.__low_size = 0
+        self.__high_size = 0
+        self.__delayed = {}
+        self.__values = collections.deque()
+
+    def add(self, value):
+        value = float(value)
+
+        if self.__low and value > -self.__low[0]:
+            heapq.heappush(self.__high, value)
+            self.__high_size += 1
+        else:
+            heapq.heappush(self.__low, -value)
+            self.__low_size += 1
+
+        if self.window is not None:
+            self.__values.append(value)
+            if len(self.__values) > self.window:
+                self.__remove(self.__values.popleft())
+
+        self.__balance()
+
+        if self.window is not None and \
+                len(self.__low) + len(self.__high) > 2 * self.window:
+            self.__compact()
+
+        return self.get()
+
+    def get(self):
+        if self.__low_size == 0:
+            return None
+        if self.__low_size > self.__high_size:
+            return -self.__low[0]
+        return (-self.__low[0] + self.__high[0]) / 2
+
+    def __remove(self, value):
+        self.__delayed[value] = self.__delayed.get(value, 0) + 1
+        if value <= -self.__low[0]:
+            self.__low_size -= 1
+            if value == -self.__low[0]:
+                self.__prune(self.__low, -1)
+        else:
+            self.__high_size -= 1
+            if value == self.__high[0]:
+                self.__prune(self.__high, 1)
+
+    def __prune(self, heap, sign):
+        while heap:
+            value = sign * heap[0]
+            count = self.__delayed.get(value, 0)
+            if count == 0:
+                break
+            if count == 1:
+                del self.__delayed[value]
+            else:
+                self.__delayed[value] = count - 1
+            heapq.heappop(heap)
+
+    def __balance(self):
+        if self.__low_size > self.__high_size + 1:
+            heapq.heappush(self.__high, -heapq.heappop(self.__low))
+            self.__low_size -= 1
+            self.__high_size += 1
+            self.__prune(self.__low, -1)
+        elif self.__low_size < self.__high_size:
+            heapq.heappush(self.__low, -heapq.heappop(self.__high))
+            self.__low_size += 1
+            self.__high_size -= 1
+            self.__prune(self.__high, 1)
+
+    def __compact(self):
+        # drop lazily deleted values buried inside the heaps
+        values = sorted(self.__values)
+        half = (len(values) + 1) // 2
+        self.__low = [-value for value in values[half - 1::-1]]
+        self.__high = values[half:]
+        self.__low_size = len(self.__low)
+        self.__high_size = len(self.__high)
+        self.__delayed = {}
+
+    def clear(self):
+        self.__low = []
+        self.__high = []
+        self.__low_size = 0
+        self.__high_size = 0
+        self.__delayed = {}
+        self.__values.clear()
+
+
+class DecayingMedian:
+    """O(1) median estimate of a stream with exponentially decaying memory
+
+    The estimate moves towards every new value by a step proportional to the
+    running mean absolute deviation, so it follows the median of roughly the
+    last 1/decay values without storing any of them.
+    """
+
+    def __init__(self, decay=0.01):
+        self.decay = decay
+        self.__median = None
+        self.__deviation = 0.0
+
+    def add(self, value):
+        value = float(value)
+
+        if self.__median is None:
+            self.__median = value
+            return value
+
+        diff = value - self.__median
+        self.__deviation += self.decay * (abs(diff) - self.__deviation)
+
+        if diff > 0:
+            self.__median += min(self.decay * self.__deviation, diff)
+        elif diff < 0:
+            self.__median -= min(self.decay * self.__deviation, -diff)
+
+        return self.__median
+
+    def get(self):
+        return self.__median
+
+    def clear(self):
+        self.__median = None
+        self.__deviation = 0.0
+
+class DropQueue:
+    """Bounded queue dropping the oldest item when full, so consumers always
+    get the most recent items and latency can't build up
+
+    With drop=False put() waits for room instead, nothing is lost.
+    """
+
+    def __init__(self, maxsize=1, drop=True):
+        self.drop = drop
+        self.__items = collections.deque(maxlen=maxsize)
+        self.__condition = threading.Condition()
+        self.closed = False
+        self.dropped = 0
+
+    def put(self, item):
+        with self.__condition:
+            if not self.drop:
+                while len(self.__items) == self.__items.maxlen and not self.closed:
+                    self.__condition.wait()
+            if len(self.__items) == self.__items.maxlen:
+                self.dropped += 1
+            self.__items.append(item)
+            self.__condition.notify_all()
+
+    def get(self):
+        """returns oldest item, blocks until one is available, None when closed"""
+
+        with self.__condition:
+            while not self.__items:
+                if self.closed:
+                    return None
+                self.__condition.wait()
+            item = self.__items.popleft()
+            self.__condition.notify_all()
+            return item
+
+    def close(self):
+        with self.__condition:
+            self.closed = True
+            self.__condition.notify_all()
+
+    def __len__(self):
+        return len(self.__items)
+
 # Bufforless
 
 
+class FrameStore:
+    """Recording of raw frames read lazily through a memory map
+
+    <path>       frames stored one after another as raw bytes
+    <path>.ts    float64 capture timestamp of every frame
+    <path>.json  shape and dtype of a single frame
+
+    Frames are zero-copy read-only views into the file, so memory use does not
+    depend on the length of the recording.
+    """
+
+    EXTENSION = ".frames"
+
+    def __init__(self, path):
+        self.path = path
+        with open(path + ".json", "r") as file:
+            header = json.load(file)
+
+        self.shape = tuple(header["shape"])
+        self.dtype = np.dtype(header["dtype"])
+        frame_size = int(np.prod(self.shape)) * self.dtype.itemsize
+
+        # count frames from file sizes, recordings cut short stay readable
+        count = os.path.getsize(path) // frame_size
+        count = min(count, os.path.getsize(path + ".ts") // 8)
+
+        if count:
+            self.frames = np.memmap(path, dtype=self.dtype, mode="r",
+                                    shape=(count,) + self.shape)
+            self.timestamps = np.memmap(path + ".ts", dtype=np.float64,
+                                        mode="r", shape=(count,))
+        else:
+            self.frames = np.zeros((0,) + self.shape, dtype=self.dtype)
+            self.timestamps = np.zeros(0, dtype=np.float64)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def __getitem__(self, index):
+        return self.frames[index]
+
+    def getTimestamp(self, index):
+        return float(self.timestamps[index])
+
+
+class FrameStoreWriter:
+    """Appends frames to a FrameStore without keeping them in memory"""
+
+    def __init__(self, path):
+        self.path = path
+        self.shape = None
+        self.count = 0
+        self.__frames = open(path, "wb")
+        self.__timestamps = open(path + ".ts", "wb")
+
+    def write(self, frame, timestamp=None):
+        if self.shape is None:
+            self.shape = frame.shape
+            self.dtype = frame.dtype
+            with open(self.path + ".json", "w") as file:
+                json.dump({"shape": list(frame.shape), "dtype": frame.dtype.str}, file)
+
+        assert frame.shape == self.shape and frame.dtype == self.dtype, \
+            "all frames of a recording must have the same shape and dtype"
+
+        self.__frames.write(np.ascontiguousarray(frame).data)
+        self.__timestamps.write(struct.pack("<d", time.time() if timestamp is None else timestamp))
+        self.count += 1
+
+    def close(self):
+        self.__frames.close()
+        self.__timestamps.close()
+
+
+def record(source, path, max_frames=None, duration=None):
+    """records frames from camera or video file into a FrameStore
+
+    Cameras are stamped with the capture time of every frame. Video files
+    are read without dropping frames and stamped start + index / fps, for
+    them duration is measured in video time.
+    """
+
+    video = isinstance(source, str) and not (
+        source.endswith(FrameStore.EXTENSION) or ".pkl" in source)
+    if video:
+        cap = cv2.VideoCapture(source)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30.0
+    else:
+        cap = VideoCapture(source)
+    writer = FrameStoreWriter(path)
+    start = time.time()
+
+    try:
+        while max_frames is None or writer.count < max_frames:
+            elapsed = writer.count / fps if video else time.time() - start
+            if duration is not None and elapsed > duration:
+                break
+            ret, frame = cap.read()
+            if not ret:
+                break
+            if video:
+                timestamp = start + writer.count / fps
+            else:
+                timestamp = cap.timestamp
+            writer.write(frame, timestamp)
+    finally:
+        writer.close()
+        if video:
+            cap.release()
+        else:
+            cap.close()
+
+    return writer.count
+
+
 class VideoCapture:
-    """Wrapper on openCV2 stream making it bufforless and adding camera search"""
+    """Wrapper on openCV2 stream making it bufforless and adding camera search
 
-    def __init__(self, name, bufforless=True):
+    Besides cameras and video files it replays FrameStore recordings (paths
+    ending with FrameStore.EXTENSION) and legacy .pkl recordings.
+
+    With pool > 0 streams are read into `pool` preallocated buffers instead
+    of a new array per frame. Only the latest frame is handed over, a frame
+    replaced before it was read counts as dropped, and timestamp holds its
+    capture time. A frame returned by read() stays valid until the next
+    read(), copy it to keep it longer. At least 3 buffers are needed so the
+    reader never has to overwrite the waiting frame (counted as overruns).
+    """
+
+    def __init__(self, name, bufforless=True, pool=0):
         self.bufforless = bufforless
+        self.pool = pool
         self.run = True
+        self.store = None
+        self.position = 0
+        self.timestamp = None
+
+        self.captured = 0
+        self.dropped = 0
+        self.overruns = 0
 
         if isinstance(name, str):
-            if ".pkl" in name:
+            if ".pkl" in name or name.endswith(FrameStore.EXTENSION):
                 self.stream = False
             else:
                 self.stream = True
@@ -156,11 +724,28 @@ class VideoCapture:
         if self.stream:
             self.prev_frame = None
 
+            # video files are stamped with the position of the frame from
+            # here on, their reader may run ahead of real time
+            self.__video_start = time.time() if isinstance(name, str) else None
             self.__openCam(name)
 
-            self.q = queue.Queue()
-            self.t = threading.Thread(target=self.__reader)
+            if pool:
+                assert pool >= 2, "a frame pool needs at least 2 buffers"
+                self.buffers = [None] * pool
+                # (buffer index, capture time) of the frame waiting for read()
+                self.__latest = None
+                self.__held = None
+                self.__done = False
+                self.__condition = threading.Condition()
+                self.t = threading.Thread(target=self.__poolReader)
+            else:
+                # without bufforless the reader waits for read() when 64
+                # frames are queued, nothing is dropped and memory is bounded
+                self.q = queue.Queue(0 if bufforless else 64)
+                self.t = threading.Thread(target=self.__reader)
             self.t.start()
+        elif name.endswith(FrameStore.EXTENSION):
+            self.store = FrameStore(name)
         else:
             self.frames = []
             with open(name, 'rb') as file:
@@ -184,6 +769,7 @@ class VideoCapture:
     def __reader(self):
         while self.run:
             ret, frame = self.cap.read()
+            stamp = self.__stamp()
             if not ret:
                 break
             if not self.q.empty() and self.bufforless:
@@ -191,25 +777,127 @@ class VideoCapture:
                     self.q.get_nowait()
                 except queue.Empty:
                     pass
-            self.q.put((ret, frame))
+            self.q.put((ret, frame, stamp))
+
+        # queued frames of a finite source are still to be read
+        if self.bufforless or not self.run:
+            self.flush()
+        # wake up readers waiting for a frame that will never come
+        self.q.put((False, None, None))
+
+    def __stamp(self):
+        """capture time of the frame just read"""
+
+        if self.__video_start is None:
+            return time.time()
+        return self.__video_start + self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+
+    def __nextBuffer(self, index):
+        """first buffer from index on that is neither held by the caller of
+        read() nor waiting to be read, the waiting one when there is none"""
 
-        self.flush()
+        pending = self.__latest[0] if self.__latest is not None else None
+        for offset in range(self.pool):
+            candidate = (index + offset) % self.pool
+            if candidate != self.__held and candidate != pending:
+                return candidate
+
+        self.__latest = None
+        self.overruns += 1
+        return pending
+
+    def __poolReader(self):
+        index = 0
+        while self.run:
+            with self.__condition:
+                index = self.__nextBuffer(index)
+
+            buffer = self.buffers[index]
+            if buffer is None:
+                ret, frame = self.cap.read()
+            else:
+                ret, frame = self.cap.read(buffer)
+            stamp = self.__stamp()
+            if not ret:
+                break
+
+            # a resolution change returns a new array, it replaces the buffer
+            self.buffers[index] = frame
+            with self.__condition:
+                self.captured += 1
+                if self.__latest is not None:
+                    self.dropped += 1
+                self.__latest = (index, stamp)
+                self.__condition.notify()
+            index = (index + 1) % self.pool
+
+        with self.__condition:
+            self.__done = True
+            self.__condition.notify_all()
 
     def flush(self):
+        if self.pool:
+            with self.__condition:
+                self.__latest = None
+            return
         while not self.q.empty():
             self.q.get()
 
     def read(self):
-        """Function returning latest frame"""
-        if self.stream:
-            return self.q.get()
+        """Function returning latest frame
+
+        In pool mode the returned array is a pool buffer, valid only until
+        the next read() reuses it. That includes lazy users of the frame like
+        Eye.getImage(), which crops from it on first call, so call those
+        before the next read() or copy the frame.
+        """
+        if self.stream and self.pool:
+            with self.__condition:
+                while self.__latest is None and not self.__done:
+                    self.__condition.wait()
+                if self.__latest is None:
+                    return (False, None)
+                index, self.timestamp = self.__latest
+                self.__latest = None
+                self.__held = index
+                return (True, self.buffers[index])
+        elif self.stream:
+            ret, frame, self.timestamp = self.q.get()
+            return (ret, frame)
+        elif self.store is not None:
+            if self.position >= len(self.store):
+                return (False, None)
+            frame = self.store[self.position]
+            self.timestamp = self.store.getTimestamp(self.position)
+            self.position += 1
+            return (True, frame)
         else:
-            frame = self.frames.pop(0)
-            self.frames.pop(0)
-            return ((len(self.frames) >= 1), frame)
+            # legacy recordings interleave frames with unused entries
+            frame = self.frames[self.position]
+            self.position += 2
+            return ((len(self.frames) - self.position >= 1), frame)
+
+    def seek(self, position):
+        """Function moving replay of a recording to given frame"""
+        assert not self.stream, "seeking is only supported for recordings"
+        self.position = position if self.store is not None else 2 * position
+
+    def getStats(self):
+        """frames captured into the pool, dropped before being read and
+        overruns of the waiting frame"""
+        return {
+            "captured": self.captured,
+            "dropped": self.dropped,
+            "overruns": self.overruns,
+        }
 
     def close(self):
         """Function closing stream"""
         self.run = False
-        self.t.join()
-        self.cap.release()
+        if self.stream:
+            if not self.pool:
+                # unblock a reader waiting for room in a full queue
+                self.flush()
+            self.t.join()
+            self.cap.release()
+
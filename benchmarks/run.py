@@ -0,0 +1,209 @@
+"""Per stage micro-benchmarks of EyeSelect on synthetic frames and landmarks.
+
+    python benchmarks/run.py --output results.json
+    python benchmarks/run.py --budget benchmarks/budget.json
+    python benchmarks/run.py --baseline results.json --tolerance 0.2
+
+Runs headless, no camera or recording is needed. Every measurement is keyed
+`stage/variant` and reports mean, p50 and p95 in microseconds. The process
+exits with status 1 when a p50 exceeds its budget or regresses against the
+baseline results by more than the tolerance.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from mediapipe.framework.formats import landmark_pb2  # noqa: E402
+
+from EyeSelect.eye import Eye  # noqa: E402
+from EyeSelect.face import Face, FaceFinder  # noqa: E402
+from EyeSelect.eyeselect import EyeSelect, EyeBaselineTracker, EyeIntermediateObject  # noqa: E402
+
+RESOLUTIONS = {
+    "480p": (640, 480),
+    "720p": (1280, 720),
+    "1080p": (1920, 1080),
+    "4k": (3840, 2160),
+}
+
+
+class _FaceMesh:
+    """stand-in for a MediaPipe face mesh result"""
+
+    def __init__(self, landmark_list):
+        self.multi_face_landmarks = [landmark_list]
+
+
+def make_landmarks(seed=0, count=478):
+    """canned normalized face landmarks, eyes are ellipses with pupils inside"""
+
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0.35, 0.65, (count, 2))
+
+    for keypoints, center in ((Eye.LEFT_EYE_KEYPOINTS, 0.56), (Eye.RIGHT_EYE_KEYPOINTS, 0.44)):
+        angles = np.linspace(0, 2 * np.pi, len(keypoints), endpoint=False)
+        points[keypoints, 0] = center + 0.03 * np.cos(angles)
+        points[keypoints, 1] = 0.45 + 0.012 * np.sin(angles)
+
+    points[Eye.LEFT_EYE_PUPIL_KEYPOINT] = (0.56, 0.45)
+    points[Eye.RIGHT_EYE_PUPIL_KEYPOINT] = (0.44, 0.45)
+    return points
+
+
+def make_face_mesh(points):
+    landmark_list = landmark_pb2.NormalizedLandmarkList()
+    for x, y in points:
+        landmark = landmark_list.landmark.add()
+        landmark.x = x
+        landmark.y = y
+        landmark.z = 0.0
+    return _FaceMesh(landmark_list)
+
+
+def make_frame(size, seed=0):
+    width, height = size
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 256, (height, width, 3), dtype=np.uint8)
+
+
+def make_eio(rng):
+    eio = EyeIntermediateObject()
+    for field in EyeBaselineTracker.FIELDS:
+        setattr(eio, field, float(rng.normal(10.0, 3.0)))
+    return eio
+
+
+def measure(func, runs, warmup=3):
+    for _ in range(warmup):
+        func()
+
+    times = np.zeros(runs)
+    for index in range(runs):
+        start = time.perf_counter()
+        func()
+        times[index] = time.perf_counter() - start
+
+    times *= 1e6
+    return {
+        "mean_us": float(times.mean()),
+        "p50_us": float(np.percentile(times, 50)),
+        "p95_us": float(np.percentile(times, 95)),
+        "runs": runs,
+    }
+
+
+def run(resolutions, runs, model_runs):
+    results = {}
+    points = make_landmarks()
+    face_mesh = make_face_mesh(points)
+
+    finder = FaceFinder(static_image_mode=True)
+    for name in resolutions:
+        size = RESOLUTIONS[name]
+        frame = make_frame(size)
+        pixels = (points * size).astype(np.float32)
+
+        results[f"FaceFinder.find/{name}"] = measure(
+            lambda: finder.find(frame), model_runs)
+
+        face = Face()
+        face.image_w, face.image_h = size
+        results[f"Face._landmarks/{name}"] = measure(
+            lambda: face._landmarks(face_mesh), runs)
+
+        face_eyes = Face(eyes_only=True)
+        face_eyes.image_w, face_eyes.image_h = size
+        results[f"Face._landmarks_eyes_only/{name}"] = measure(
+            lambda: face_eyes._landmarks(face_mesh), runs)
+
+        eye = Eye(0)
+        offset = np.zeros(2)
+        results[f"Eye._process/{name}"] = measure(
+            lambda: eye.update(frame, pixels, offset), runs)
+
+        eyeselect = EyeSelect(finder=False)
+        eyeselect.face.processLandmarks(pixels, frame)
+        results[f"EyeSelect.features/{name}"] = measure(
+            lambda: eyeselect._process_features(-100, 100, 1.5, 100, None), runs)
+
+    rng = np.random.default_rng(0)
+    eio = make_eio(rng)
+    for frames in (1000, 100000):
+        for mode, kwargs in (("session", {}), ("window", {"window": 9000}), ("decay", {"decay": 0.01})):
+            tracker = EyeBaselineTracker(**kwargs)
+            for _ in range(frames):
+                tracker.add_obj(make_eio(rng))
+            results[f"EyeBaselineTracker.add_obj/{mode}_{frames}"] = measure(
+                lambda: tracker.add_obj(eio), runs)
+
+    noop = lambda: None
+    eyeselect = EyeSelect(left_cb=noop, right_cb=noop, blink_cb=noop, up_cb=noop, finder=False)
+    eyeselect.baseline.add_obj(eio)
+    timestamp = [0.0]
+
+    def select():
+        timestamp[0] += 1 / 30
+        eyeselect.eventSelector.select(eio, timestamp[0])
+
+    results["EventSelector.select/idle"] = measure(select, runs)
+    return results
+
+
+def check(results, budget=None, baseline=None, tolerance=0.2):
+    failures = []
+    for key, result in results.items():
+        if budget is not None and key in budget and result["p50_us"] > budget[key]:
+            failures.append(f"{key}: p50 {result['p50_us']:.1f}us over budget {budget[key]:.1f}us")
+        if baseline is not None and key in baseline:
+            limit = baseline[key]["p50_us"] * (1 + tolerance)
+            if result["p50_us"] > limit:
+                failures.append(f"{key}: p50 {result['p50_us']:.1f}us regressed from "
+                                f"{baseline[key]['p50_us']:.1f}us")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--resolutions", nargs="+", default=list(RESOLUTIONS),
+                        choices=list(RESOLUTIONS))
+    parser.add_argument("--runs", type=int, default=500)
+    parser.add_argument("--model-runs", type=int, default=20)
+    parser.add_argument("--output", help="write results as JSON to this path")
+    parser.add_argument("--budget", help="JSON mapping keys to maximum p50 in microseconds")
+    parser.add_argument("--baseline", help="results JSON of a previous run to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run(args.resolutions, args.runs, args.model_runs)
+
+    for key, result in results.items():
+        print(f"{key:55s} mean {result['mean_us']:10.1f}us  p50 {result['p50_us']:10.1f}us"
+              f"  p95 {result['p95_us']:10.1f}us")
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    budget = baseline = None
+    if args.budget:
+        with open(args.budget, "r") as file:
+            budget = json.load(file)
+    if args.baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)
+
+    failures = check(results, budget, baseline, args.tolerance)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())